@@ -0,0 +1,12 @@
+"""
+Compile the flow data files into the pack loaded by /api/flow/data/.
+
+Run from the server directory after the flow data changes:
+    python build_flow_pack.py
+"""
+from routers.flow import metadata_path, data_path, pack_path
+from routers.FlowDBUtils import build_pack
+
+if __name__ == "__main__":
+    count = build_pack(metadata_path, data_path, pack_path)
+    print("packed {} files into {}".format(count, pack_path))
@@ -1,2 +1,9 @@
 from .local import *
 from .post_process import *
+from .cache import *
+from .similarity import *
+from .state import *
+from .loader import *
+from .edit import *
+from .bitmap import *
+from .pack import *
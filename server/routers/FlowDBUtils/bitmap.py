@@ -0,0 +1,109 @@
+import re
+
+# parentheses, double-quoted names and the AND/OR/NOT keywords, anything in
+# between is a bare category name (which may contain spaces)
+TOKEN_PATTERN = re.compile(r'(\(|\)|"(?:[^"\\]|\\.)*"|\bAND\b|\bOR\b|\bNOT\b)')
+
+
+def tokenize(expression):
+    tokens = []
+    for part in TOKEN_PATTERN.split(expression):
+        part = part.strip()
+        if part == "":
+            continue
+        if part.startswith('"'):
+            tokens.append(("name", re.sub(r"\\(.)", r"\1", part[1:-1])))
+        elif part in ("(", ")", "AND", "OR", "NOT"):
+            tokens.append((part, part))
+        else:
+            tokens.append(("name", part))
+    return tokens
+
+
+class CategoryIndex:
+    """
+    category_dict as bitsets over participant ordinals.
+
+    Each category key (e.g. `factors-<cat>`) maps to a Python int whose bit i
+    is set when the i-th participant has that category, so boolean filters
+    are word-wise integer operations.
+    """
+
+    def __init__(self, pids, category_dict):
+        self.pids = list(pids)
+        ordinal = {pid: i for i, pid in enumerate(self.pids)}
+        self.universe = (1 << len(self.pids)) - 1
+        self.bitsets = {}
+        for key, key_pids in category_dict.items():
+            bits = 0
+            for pid in key_pids:
+                bits |= 1 << ordinal[pid]
+            self.bitsets[key] = bits
+
+    def ids(self, bits):
+        res = []
+        while bits:
+            lowest = bits & -bits
+            res.append(self.pids[lowest.bit_length() - 1])
+            bits ^= lowest
+        return res
+
+    def query(self, expression):
+        """
+        Evaluate e.g. `factors-X AND fairness-unfair AND NOT categories-Y`.
+        NOT binds tighter than AND, AND tighter than OR; parentheses group.
+        Names containing keywords or parentheses can be double-quoted.
+        Returns the matching bitset and the names not in the index, which
+        match no participant. Raises ValueError on a malformed expression.
+        """
+        tokens = tokenize(expression)
+        unknown = []
+        position = 0
+
+        def peek():
+            return tokens[position][0] if position < len(tokens) else None
+
+        def advance():
+            nonlocal position
+            position += 1
+            return tokens[position - 1]
+
+        def parse_or():
+            bits = parse_and()
+            while peek() == "OR":
+                advance()
+                bits |= parse_and()
+            return bits
+
+        def parse_and():
+            bits = parse_not()
+            while peek() == "AND":
+                advance()
+                bits &= parse_not()
+            return bits
+
+        def parse_not():
+            kind = peek()
+            if kind == "NOT":
+                advance()
+                return self.universe & ~parse_not()
+            if kind == "(":
+                advance()
+                bits = parse_or()
+                if peek() != ")":
+                    raise ValueError("missing closing parenthesis")
+                advance()
+                return bits
+            if kind == "name":
+                name = advance()[1]
+                if name not in self.bitsets:
+                    unknown.append(name)
+                return self.bitsets.get(name, 0)
+            if kind is None:
+                raise ValueError("unexpected end of expression")
+            raise ValueError("unexpected '{}'".format(kind))
+
+        bits = parse_or()
+        if position != len(tokens):
+            raise ValueError("unexpected '{}'".format(tokens[position][1]))
+        return bits, unknown
@@ -0,0 +1,88 @@
+import glob
+import os
+import threading
+
+
+def file_signature(patterns):
+    """(mtime, size) of every file matched by the glob patterns, keyed by path."""
+    signature = {}
+    for pattern in patterns:
+        for filepath in glob.glob(pattern):
+            try:
+                stat = os.stat(filepath)
+            except FileNotFoundError:
+                # deleted between glob and stat, the next call will see it gone
+                continue
+            signature[filepath] = (stat.st_mtime_ns, stat.st_size)
+    return signature
+
+
+class SnapshotCache:
+    """
+    Process-level cache for a value derived from a set of files.
+
+    The value is rebuilt by `builder` only when a watched file is added,
+    removed, or its mtime/size changes; otherwise `get` is a dictionary
+    lookup plus one stat per watched file. If `patcher` is given it is
+    first offered the list of modified files and may update the cached
+    value in place, returning False to fall back to a full rebuild.
+    """
+
+    def __init__(self, builder, patterns, patcher=None):
+        self.builder = builder
+        self.patterns = list(patterns)
+        self.patcher = patcher
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.signature = None
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.patches = 0
+
+    def get(self):
+        signature = file_signature(self.patterns)
+        with self.lock:
+            if self.snapshot is not None and signature == self.signature:
+                self.hits += 1
+                return self.snapshot
+            self.misses += 1
+            if self.patch(signature):
+                self.signature = signature
+                self.patches += 1
+                return self.snapshot
+            self.snapshot = self.builder()
+            self.signature = signature
+            self.rebuilds += 1
+            return self.snapshot
+
+    def patch(self, signature):
+        if self.patcher is None or self.snapshot is None:
+            return False
+        if signature.keys() != self.signature.keys():
+            # files were added or removed
+            return False
+        changed = [
+            filepath
+            for filepath, file_stat in signature.items()
+            if self.signature[filepath] != file_stat
+        ]
+        try:
+            return self.patcher(self.snapshot, changed)
+        except Exception:
+            return False
+
+    def invalidate(self):
+        with self.lock:
+            self.snapshot = None
+            self.signature = None
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "rebuilds": self.rebuilds,
+            "patches": self.patches,
+            "cached": self.snapshot is not None,
+            "watched_files": len(self.signature or {}),
+        }
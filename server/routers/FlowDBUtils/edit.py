@@ -0,0 +1,85 @@
+import os
+from contextlib import ExitStack
+from .local import (
+    load_json,
+    save_json,
+    file_lock,
+    data_edit_file,
+    metadata_edit_file,
+    apply_data_edit,
+    apply_metadata_edit,
+)
+
+
+def apply_edits(data_path, metadata_path, data_edits, metadata_edits):
+    """
+    Apply a batch of update_data / update_metadata operations.
+
+    Operations are grouped per file so every file is read and written once,
+    in the order its operations were given. All files in the batch are
+    locked, every operation is applied in memory, and only then are the
+    files written, so a failing operation leaves all files untouched.
+    Raises ValueError naming the first operation that could not be applied.
+    """
+    groups = {}
+    for index, edit in enumerate(data_edits):
+        if os.path.basename(edit["pid"]) != edit["pid"]:
+            raise ValueError("data edit {}: invalid pid".format(index))
+        filepath = data_edit_file(
+            data_path, edit["pid"], edit["action"], edit["section"]
+        )
+        groups.setdefault(filepath, []).append(("data", index, edit))
+    for index, edit in enumerate(metadata_edits):
+        try:
+            filepath = metadata_edit_file(metadata_path, edit["section"])
+        except KeyError:
+            raise ValueError(
+                "metadata edit {}: unknown section '{}'".format(index, edit["section"])
+            )
+        groups.setdefault(filepath, []).append(("metadata", index, edit))
+
+    with ExitStack() as stack:
+        # sorted so two batches touching the same files cannot deadlock
+        for filepath in sorted(groups):
+            stack.enter_context(file_lock(filepath))
+        updated = {}
+        for filepath, operations in groups.items():
+            try:
+                data = load_json(filepath)
+            except FileNotFoundError:
+                raise ValueError(
+                    "file not found: {}".format(os.path.basename(filepath))
+                )
+            for kind, index, edit in operations:
+                try:
+                    if kind == "data":
+                        data = apply_data_edit(
+                            data,
+                            edit["action"],
+                            edit["section"],
+                            edit["column"],
+                            edit["before"],
+                            edit["before_value"],
+                            edit["after"],
+                        )
+                    else:
+                        data = apply_metadata_edit(
+                            data,
+                            edit["action"],
+                            edit["section"],
+                            edit["column"],
+                            edit["value"],
+                        )
+                except (KeyError, IndexError, TypeError, AssertionError) as e:
+                    raise ValueError(
+                        "{} edit {} ({} {}) could not be applied: {!r}".format(
+                            kind, index, edit["action"], edit["section"], e
+                        )
+                    )
+            updated[filepath] = data
+        for filepath, data in updated.items():
+            save_json(data, filepath)
+    return {
+        "operations": len(data_edits) + len(metadata_edits),
+        "files_written": len(updated),
+    }
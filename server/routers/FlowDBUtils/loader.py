@@ -0,0 +1,73 @@
+import glob
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .local import load_json, prepare_interview
+
+DEFAULT_MAX_WORKERS = min(16, (os.cpu_count() or 1) + 4)
+
+
+def timed_load_json(filepath):
+    start = time.perf_counter()
+    data = load_json(filepath)
+    return data, time.perf_counter() - start
+
+
+def load_data(data_path, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Parallel counterpart of read_participant_metadata + read_data.
+
+    Interviews and participant metadata are read in one pass over a bounded
+    thread pool. Returns the same background/drivers_of_change/
+    future_management/decision_making lists and participant metadata dict,
+    plus a load report with per-file timings in seconds.
+    """
+    start = time.perf_counter()
+    metadata_files = glob.glob(data_path + "metadata/*.json")
+    interview_files = glob.glob(data_path + "*.json")
+    filepaths = metadata_files + interview_files
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(timed_load_json, filepaths))
+    loaded = dict(zip(filepaths, results))
+
+    participant_metadata_dict = {}
+    for metadata_file in metadata_files:
+        p_metadata = loaded[metadata_file][0]
+        participant_metadata_dict[p_metadata["Interviewee"]] = p_metadata
+
+    background = []
+    drivers_of_change = []
+    future_management = []
+    decision_making = []
+    for interview_file in interview_files:
+        participant = os.path.basename(interview_file).replace(".json", "")
+        (
+            background_entry,
+            drivers_entry,
+            management_entry,
+            decision_entry,
+        ) = prepare_interview(
+            loaded[interview_file][0], participant, participant_metadata_dict
+        )
+        background.append(background_entry)
+        drivers_of_change.append(drivers_entry)
+        future_management.append(management_entry)
+        decision_making.append(decision_entry)
+
+    load_report = {
+        "files": len(filepaths),
+        "workers": max_workers,
+        "total_seconds": time.perf_counter() - start,
+        "file_seconds": {
+            os.path.relpath(filepath, data_path): seconds
+            for filepath, (_, seconds) in loaded.items()
+        },
+    }
+    return (
+        background,
+        drivers_of_change,
+        future_management,
+        decision_making,
+        participant_metadata_dict,
+        load_report,
+    )
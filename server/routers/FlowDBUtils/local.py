@@ -2,9 +2,38 @@ import re
 import json
 import glob
 import os
+import tempfile
+import threading
+from collections import defaultdict
+
+# one lock per file so concurrent writers to the same file are serialized
+_file_locks = defaultdict(threading.Lock)
+_file_locks_guard = threading.Lock()
+
+def file_lock(filepath):
+    with _file_locks_guard:
+        return _file_locks[os.path.normpath(filepath)]
+
 def save_json(data, filepath):
-    with open(filepath, 'w', encoding='utf-8') as fp:
-        json.dump(data, fp, indent=4)
+    # write to a temp file next to the target and rename it over, so readers
+    # never see a half-written file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filepath), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+            json.dump(data, fp, indent=4)
+            fp.flush()
+            os.fsync(fp.fileno())
+        if os.path.exists(filepath):
+            # mkstemp creates the file as 0600, keep the original mode
+            os.chmod(tmp_path, os.stat(filepath).st_mode & 0o777)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def load_json(filepath):
+    with open(filepath) as f:
+        return json.load(f)
 
 def reverse_index(dict_of_list, post_process_func):
     res = {}
@@ -13,12 +42,12 @@ def reverse_index(dict_of_list, post_process_func):
             res[post_process_func(element)] = post_process_func(group_label)
     return res
 
-def read_metadata(metadata_path):
+def read_metadata(metadata_path, load=load_json):
     # metadata for categories
-    factor_categories = json.load(open(metadata_path + 'factor_categories.json'))
-    stakeholder_categories = json.load(open(metadata_path + 'stakeholder_group_categories.json'))
-    strategy_categories = json.load(open(metadata_path + 'strategy_categories.json'))
-    participant_categories = json.load(open(metadata_path + 'participant_categories.json'))
+    factor_categories = load(metadata_path + 'factor_categories.json')
+    stakeholder_categories = load(metadata_path + 'stakeholder_group_categories.json')
+    strategy_categories = load(metadata_path + 'strategy_categories.json')
+    participant_categories = load(metadata_path + 'participant_categories.json')
     metadata = {
         'participant_categories': participant_categories,
         'strategy_categories': strategy_categories,
@@ -45,116 +74,147 @@ def read_data(data_path, participant_metadata_dict):
     decision_making = [] 
 
     for interview_file in glob.glob(data_path + "*.json"):
-        interview_data = json.load(open(interview_file))
-        participant_id = interview_data[0]['id'].split("_")[0]
+        interview_data = load_json(interview_file)
         participant = os.path.basename(interview_file).replace(".json", "")
-        # add id to background summary
-        interview_data[0]['summary']['id'] = participant_id
-        interview_data[0]['summary']['categories'] = participant_metadata_dict[participant]['Categories']
-        background.append(interview_data[0])
-
-        # add id to drivers summary
-        interview_data[1]['summary']['id'] = participant_id
-        # keep top three
-        interview_data[1]['summary']['factors'] = interview_data[1]['summary']['factors']
-        drivers_of_change.append(interview_data[1])
-
-        # add id to management summary
-        interview_data[2]['summary']['id'] = participant_id
-        future_management.append(interview_data[2])
-
-        # add id to decision making summary
-        interview_data[3]['summary']['id'] = participant_id
-        # lower case fair/unfair
-        interview_data[3]['summary']['Is the process fair'] = interview_data[3]['summary']['Is the process fair'].lower()
-        decision_making.append(interview_data[3])
+        background_entry, drivers_entry, management_entry, decision_entry = prepare_interview(interview_data, participant, participant_metadata_dict)
+        background.append(background_entry)
+        drivers_of_change.append(drivers_entry)
+        future_management.append(management_entry)
+        decision_making.append(decision_entry)
     return background, drivers_of_change, future_management, decision_making, participant_metadata_dict
 
-def update_data(data_path, pid, action, section, column, before, before_value, after):
+def prepare_interview(interview_data, participant, participant_metadata_dict):
+    participant_id = interview_data[0]['id'].split("_")[0]
+    # add id to background summary
+    interview_data[0]['summary']['id'] = participant_id
+    interview_data[0]['summary']['categories'] = participant_metadata_dict[participant]['Categories']
+
+    # add id to drivers summary
+    interview_data[1]['summary']['id'] = participant_id
+    # keep top three
+    interview_data[1]['summary']['factors'] = interview_data[1]['summary']['factors']
+
+    # add id to management summary
+    interview_data[2]['summary']['id'] = participant_id
+
+    # add id to decision making summary
+    interview_data[3]['summary']['id'] = participant_id
+    # lower case fair/unfair
+    interview_data[3]['summary']['Is the process fair'] = interview_data[3]['summary']['Is the process fair'].lower()
+    return interview_data[0], interview_data[1], interview_data[2], interview_data[3]
+
+def read_participant_data(data_path, participant, participant_metadata_dict):
+    # re-read a single participant's interview, same post-processing as read_data
+    interview_data = load_json(data_path + "{}.json".format(participant))
+    return prepare_interview(interview_data, participant, participant_metadata_dict)
+
+def data_edit_file(data_path, pid, action, section):
+    # background category deletes/moves live in the participant metadata file
     if section == 'background' and action in ['delete', 'move']:
-        filepath = data_path + "metadata/{}.json".format(pid)
-        participant_metadata = json.load(open(filepath))
-        if action == 'delete':
-            participant_metadata['Categories'] = list(filter(lambda x: x != before, participant_metadata['Categories']))
-        elif action == 'move':
-            participant_metadata['Categories'] = [after if x == before else x for x in participant_metadata['Categories']]
-        save_json(participant_metadata, filepath)
-    else:
-        filepath = data_path + "{}.json".format(pid)
-        interview_data = json.load(open(filepath))
-        section_index = {
-            'background': 0,
-            'drivers_of_change': 1,
-            'future_management': 2,
-            'decision_making': 3
-        }
-        column_key = {
-            'category-': 'relationship to the delta',
-            'factor-category-': 'factors',
-            'strategy-': 'important salinity management strategies',
-            'rect-': 'Is the process fair',
-            'represented-': 'Who is represented',
-            'not-represented-': 'Who is not represented',
-            'others-to-include-': 'What other people to connect with',
-        }
-        obj_key = {
-            'factor-category-': 'factor_name',
-            'strategy-': 'strategy',
-            'represented-': 'group',
-            'not-represented-': 'group',
-            'others-to-include-': 'group',
-        }
-        section_data = interview_data[section_index[section]]['summary']
-        obj = section_data[column_key[column]]
-        if action == 'edit':
-            if type(obj) is list:
-                for index, x in enumerate(obj):
-                    if x[obj_key[column]] == before:
-                        obj[index][obj_key[column]] = after
-            elif isinstance(obj, dict):
-                obj[obj_key[column]] = after
-            else:
-                obj = after
-            section_data[column_key[column]] = obj
-        elif action == 'add':
-            assert(type(obj) is list)
-            obj.append({
-                obj_key[column]: after,
-                'category': before
-            })
-            section_data[column_key[column]] = obj
-        elif action == 'delete': 
-            assert(type(obj) is list)
-            obj = list(filter(lambda x: x[obj_key[column]] != before, obj))
-            section_data[column_key[column]] = obj
-        elif action == 'move':
-            if type(obj) is list:
-                for index, x in enumerate(obj):
-                    if x[obj_key[column]] == before_value:
-                        obj[index]['category'] = after
-            elif isinstance(obj, dict): 
-                obj['category'] = after
-            else:
-                assert(column == 'rect-')
-                obj = after
-            section_data[column_key[column]] = obj
-        interview_data[section_index[section]]['summary'] = section_data
-        save_json(interview_data, filepath)
-    return
+        return data_path + "metadata/{}.json".format(pid)
+    return data_path + "{}.json".format(pid)
 
-def update_metadata(metadata_path, action, section, column, value):
+def metadata_edit_file(metadata_path, section):
     file_name = {
         'background': 'participant_categories.json',
         'drivers_of_change': 'factor_categories.json',
         'future_management': 'strategy_categories.json',
         'decision_making': 'stakeholder_group_categories.json'
     }
+    return metadata_path + file_name[section]
+
+def update_data(data_path, pid, action, section, column, before, before_value, after):
+    filepath = data_edit_file(data_path, pid, action, section)
+    with file_lock(filepath):
+        data = load_json(filepath)
+        data = apply_data_edit(data, action, section, column, before, before_value, after)
+        save_json(data, filepath)
+    return
+
+def apply_data_edit(data, action, section, column, before, before_value, after):
+    # data is the content of data_edit_file(...) for the same action and section
+    if section == 'background' and action in ['delete', 'move']:
+        participant_metadata = data
+        if action == 'delete':
+            participant_metadata['Categories'] = list(filter(lambda x: x != before, participant_metadata['Categories']))
+        elif action == 'move':
+            participant_metadata['Categories'] = [after if x == before else x for x in participant_metadata['Categories']]
+        return participant_metadata
+    interview_data = data
+    section_index = {
+        'background': 0,
+        'drivers_of_change': 1,
+        'future_management': 2,
+        'decision_making': 3
+    }
+    column_key = {
+        'category-': 'relationship to the delta',
+        'factor-category-': 'factors',
+        'strategy-': 'important salinity management strategies',
+        'rect-': 'Is the process fair',
+        'represented-': 'Who is represented',
+        'not-represented-': 'Who is not represented',
+        'others-to-include-': 'What other people to connect with',
+    }
+    obj_key = {
+        'factor-category-': 'factor_name',
+        'strategy-': 'strategy',
+        'represented-': 'group',
+        'not-represented-': 'group',
+        'others-to-include-': 'group',
+    }
+    section_data = interview_data[section_index[section]]['summary']
+    obj = section_data[column_key[column]]
+    if action == 'edit':
+        if type(obj) is list:
+            for index, x in enumerate(obj):
+                if x[obj_key[column]] == before:
+                    obj[index][obj_key[column]] = after
+        elif isinstance(obj, dict):
+            obj[obj_key[column]] = after
+        else:
+            obj = after
+        section_data[column_key[column]] = obj
+    elif action == 'add':
+        assert(type(obj) is list)
+        obj.append({
+            obj_key[column]: after,
+            'category': before
+        })
+        section_data[column_key[column]] = obj
+    elif action == 'delete': 
+        assert(type(obj) is list)
+        obj = list(filter(lambda x: x[obj_key[column]] != before, obj))
+        section_data[column_key[column]] = obj
+    elif action == 'move':
+        if type(obj) is list:
+            for index, x in enumerate(obj):
+                if x[obj_key[column]] == before_value:
+                    obj[index]['category'] = after
+        elif isinstance(obj, dict): 
+            obj['category'] = after
+        else:
+            assert(column == 'rect-')
+            obj = after
+        section_data[column_key[column]] = obj
+    interview_data[section_index[section]]['summary'] = section_data
+    return interview_data
+
+def update_metadata(metadata_path, action, section, column, value):
+    filepath = metadata_edit_file(metadata_path, section)
+    with file_lock(filepath):
+        metadata = load_json(filepath)
+        metadata = apply_metadata_edit(metadata, action, section, column, value)
+        save_json(metadata, filepath)
+
+    return
+
+def apply_metadata_edit(metadata, action, section, column, value):
     column_name_dict = {
         'represented-': 'represented',
         'not-represented-': 'not_represented',
         'others-to-include-': 'others_to_include'
     }
-    metadata = json.load(open(metadata_path + file_name[section]))
     if section == "decision_making":
         column_obj = metadata[column_name_dict[column]]
         if action == 'add':
@@ -167,19 +227,21 @@ def update_metadata(metadata_path, action, section, column, value):
             metadata.append(value)
         elif action == 'remove':
             metadata = list(filter(lambda x: x != value, metadata))
-    save_json(metadata, metadata_path + file_name[section])
-
-    return
+    return metadata
 
 def read_participant_metadata(data_path):
     participant_metadata_dict = {}
     for metadata_file in glob.glob(data_path + "metadata/*.json"):
-        p_metadata = json.load(open(metadata_file))
+        p_metadata = load_json(metadata_file)
         participant = p_metadata['Interviewee']
         participant_metadata_dict[participant] = p_metadata
     return participant_metadata_dict
+
+def read_participant_metadata_file(metadata_file):
+    return load_json(metadata_file)
+
 def clean_up_commas(text):
     # replace ',' inside parenthesis with 'and'
     pattern = r'\(([^)]*)\)'
     text = re.sub(pattern, lambda match: match.group(0).replace(',', ' and'), text)
-    return text
\ No newline at end of file
+    return text
@@ -0,0 +1,161 @@
+import glob
+import json
+import os
+import sqlite3
+import time
+from .local import read_metadata, prepare_interview
+
+# bump whenever the pack layout changes, older packs are then ignored
+PACK_VERSION = 1
+
+CATEGORY_METADATA_FILES = [
+    "factor_categories.json",
+    "stakeholder_group_categories.json",
+    "strategy_categories.json",
+    "participant_categories.json",
+]
+
+
+def pack_sources(metadata_path, data_path):
+    """The raw files that go into a pack, as (kind, path) in load order."""
+    sources = [
+        ("category_metadata", metadata_path + name) for name in CATEGORY_METADATA_FILES
+    ]
+    sources += [
+        ("participant_metadata", path)
+        for path in glob.glob(data_path + "metadata/*.json")
+    ]
+    sources += [("interview", path) for path in glob.glob(data_path + "*.json")]
+    return sources
+
+
+def source_signature(sources):
+    signature = {}
+    for _, path in sources:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature[os.path.normpath(path)] = [stat.st_mtime_ns, stat.st_size]
+    return signature
+
+
+def build_pack(metadata_path, data_path, pack_path):
+    """
+    Compile the flow JSON files into one SQLite file. The pack is written
+    next to `pack_path` and renamed over it, so readers never see a partial
+    pack.
+    """
+    sources = pack_sources(metadata_path, data_path)
+    tmp_path = pack_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        connection.execute(
+            "CREATE TABLE files (position INTEGER PRIMARY KEY, kind TEXT, name TEXT, body TEXT)"
+        )
+        for position, (kind, path) in enumerate(sources):
+            with open(path) as f:
+                body = f.read()
+            connection.execute(
+                "INSERT INTO files VALUES (?, ?, ?, ?)",
+                (position, kind, os.path.basename(path), body),
+            )
+        connection.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [
+                ("version", str(PACK_VERSION)),
+                ("built_at", time.strftime("%Y-%m-%dT%H:%M:%S")),
+                ("sources", json.dumps(source_signature(sources))),
+            ],
+        )
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, pack_path)
+    return len(sources)
+
+
+def pack_is_fresh(pack_path, metadata_path, data_path):
+    """
+    True when the pack exists, has the current layout version and was built
+    from the raw files as they are now. A pack shipped without the raw
+    files is always fresh.
+    """
+    if not os.path.exists(pack_path):
+        return False
+    try:
+        connection = sqlite3.connect("file:{}?mode=ro".format(pack_path), uri=True)
+        try:
+            meta = dict(connection.execute("SELECT key, value FROM meta"))
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return False
+    if meta.get("version") != str(PACK_VERSION):
+        return False
+    current = source_signature(pack_sources(metadata_path, data_path))
+    return len(current) == 0 or current == json.loads(meta["sources"])
+
+
+def load_pack(pack_path):
+    """
+    Same structures as read_metadata + load_data, from one sequential read
+    of the pack.
+    """
+    start = time.perf_counter()
+    connection = sqlite3.connect("file:{}?mode=ro".format(pack_path), uri=True)
+    try:
+        rows = connection.execute(
+            "SELECT kind, name, body FROM files ORDER BY position"
+        ).fetchall()
+    finally:
+        connection.close()
+
+    category_metadata = {}
+    participant_metadata_dict = {}
+    interviews = []
+    for kind, name, body in rows:
+        if kind == "category_metadata":
+            category_metadata[name] = json.loads(body)
+        elif kind == "participant_metadata":
+            p_metadata = json.loads(body)
+            participant_metadata_dict[p_metadata["Interviewee"]] = p_metadata
+        else:
+            interviews.append((name, json.loads(body)))
+    metadata = read_metadata(
+        "", load=lambda filepath: category_metadata[os.path.basename(filepath)]
+    )
+
+    background = []
+    drivers_of_change = []
+    future_management = []
+    decision_making = []
+    for name, interview_data in interviews:
+        participant = name.replace(".json", "")
+        (
+            background_entry,
+            drivers_entry,
+            management_entry,
+            decision_entry,
+        ) = prepare_interview(interview_data, participant, participant_metadata_dict)
+        background.append(background_entry)
+        drivers_of_change.append(drivers_entry)
+        future_management.append(management_entry)
+        decision_making.append(decision_entry)
+
+    load_report = {
+        "files": len(rows),
+        "pack": os.path.basename(pack_path),
+        "total_seconds": time.perf_counter() - start,
+    }
+    return (
+        metadata,
+        background,
+        drivers_of_change,
+        future_management,
+        decision_making,
+        participant_metadata_dict,
+        load_report,
+    )
+
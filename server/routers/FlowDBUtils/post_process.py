@@ -1,7 +1,7 @@
 import re
 from collections import defaultdict
 import collections
-import numpy as np
+from .similarity import SimilarityEngine
 def prepareParticipantData(background, drivers_of_change, future_management, decision_making):
     participant_data = {}
     category_dict = defaultdict(list)
@@ -119,19 +119,9 @@ def prepareParticipantData(background, drivers_of_change, future_management, dec
                 category_dict[key + "-" + data[key]].append(pid)
     return participant_data, category_dict
 
-def calculateSimilarity(participant_data):
-    features = ['categories', 'factors', 'strategies', 'fairness', 'represented_groups', 'not_represented_groups', 'others_to_include']
-    sim_matrix = defaultdict(dict)
-
-    for i1, datum1 in enumerate(list(participant_data.values())):
-        pid1 = datum1['id']
-        for i2, datum2 in enumerate(list(participant_data.values())):
-            pid2 = datum2['id']
-            feature_sims = np.array([jaccard_similarity(list(datum1[key]), list(datum2[key])) for key in features])
-            overall_sim = np.mean(feature_sims)
-            sim_matrix[pid1][pid2] = overall_sim
-
-    return sim_matrix
+def calculateSimilarity(participant_data, category_dict=None):
+    engine = SimilarityEngine(participant_data, category_dict)
+    return engine.to_dict()
 
 def jaccard_similarity(list1: list, list2: list):
     if not isinstance(list1, collections.abc.Sequence):
@@ -0,0 +1,166 @@
+import base64
+from collections import defaultdict
+import numpy as np
+
+# quantized matrices store round(similarity * 255)
+SIMILARITY_DTYPES = {"float32": ("<f4", 1.0), "uint8": ("u1", 1 / 255)}
+
+SIMILARITY_FEATURES = [
+    "categories",
+    "factors",
+    "strategies",
+    "fairness",
+    "represented_groups",
+    "not_represented_groups",
+    "others_to_include",
+]
+
+
+def jaccard_matrix(X):
+    """Pairwise Jaccard of the rows of a binary matrix, 0 where the union is empty."""
+    X = np.asarray(X, dtype=np.float64)
+    intersection = X @ X.T
+    sizes = X.sum(axis=1)
+    union = sizes[:, None] + sizes[None, :] - intersection
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sims = np.where(union > 0, intersection / union, 0.0)
+    return sims
+
+
+def feature_values(datum, feature):
+    # single-valued features (fairness) are a one-element set, so their
+    # jaccard score is 1 if the values are equal and 0 otherwise
+    value = datum[feature]
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+class SimilarityEngine:
+    """
+    Participant similarity as the mean of per-feature Jaccard scores.
+
+    Each feature is encoded once as a participant x category binary matrix
+    whose columns follow the `category_dict` keys from prepareParticipantData,
+    and all pairwise scores are computed with matrix products.
+    """
+
+    def __init__(self, participant_data, category_dict=None):
+        self.pids = [datum["id"] for datum in participant_data.values()]
+        self.index = {pid: i for i, pid in enumerate(self.pids)}
+        self.columns = {feature: {} for feature in SIMILARITY_FEATURES}
+        if category_dict is not None:
+            for key in category_dict:
+                for feature in SIMILARITY_FEATURES:
+                    if key.startswith(feature + "-"):
+                        self.columns[feature].setdefault(
+                            key[len(feature) + 1 :], len(self.columns[feature])
+                        )
+                        break
+        for datum in participant_data.values():
+            for feature in SIMILARITY_FEATURES:
+                for category in feature_values(datum, feature):
+                    self.columns[feature].setdefault(
+                        category, len(self.columns[feature])
+                    )
+        self.matrices = {}
+        for feature in SIMILARITY_FEATURES:
+            X = np.zeros((len(self.pids), len(self.columns[feature])))
+            for datum in participant_data.values():
+                row = self.index[datum["id"]]
+                for category in feature_values(datum, feature):
+                    X[row, self.columns[feature][category]] = 1
+            self.matrices[feature] = X
+        self.similarity = self.compute()
+        self._nearest = None
+        self._encoded = {}
+
+    def compute(self):
+        feature_sims = np.stack(
+            [jaccard_matrix(self.matrices[feature]) for feature in SIMILARITY_FEATURES]
+        )
+        return np.mean(feature_sims, axis=0)
+
+    def nearest(self, k):
+        """
+        Indices and scores of each participant's k most similar peers (self
+        excluded), best first. The per-row partial sort is kept and reused
+        for any k up to the largest one computed so far.
+        """
+        k = max(0, min(k, len(self.pids) - 1))
+        if self._nearest is None or self._nearest[0].shape[1] < k:
+            sims = self.similarity.copy()
+            np.fill_diagonal(sims, -np.inf)
+            if k < len(self.pids) - 1:
+                candidates = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            else:
+                candidates = np.tile(np.arange(len(self.pids)), (len(self.pids), 1))
+            scores = np.take_along_axis(sims, candidates, axis=1)
+            # best score first, ties broken by participant order
+            order = np.lexsort((candidates, -scores), axis=1)[:, :k]
+            self._nearest = (
+                np.take_along_axis(candidates, order, axis=1),
+                np.take_along_axis(scores, order, axis=1),
+            )
+        indices, scores = self._nearest
+        return indices[:, :k], scores[:, :k]
+
+    def encode(self, dtype="float32"):
+        """
+        Compact form of the matrix: a header with the ordered ids and the
+        row-major little-endian matrix bytes. Multiply by `scale` to decode.
+        """
+        if dtype not in self._encoded:
+            numpy_dtype, scale = SIMILARITY_DTYPES[dtype]
+            if dtype == "uint8":
+                matrix = np.rint(self.similarity * 255)
+            else:
+                matrix = self.similarity
+            header = {
+                "ids": self.pids,
+                "dtype": dtype,
+                "shape": [len(self.pids), len(self.pids)],
+                "scale": scale,
+            }
+            self._encoded[dtype] = (header, matrix.astype(numpy_dtype).tobytes())
+        return self._encoded[dtype]
+
+    def encode_base64(self, dtype="float32"):
+        header, data = self.encode(dtype)
+        return {**header, "data": base64.b64encode(data).decode("ascii")}
+
+    def to_dict(self):
+        sim_matrix = defaultdict(dict)
+        for i1, pid1 in enumerate(self.pids):
+            row = self.similarity[i1]
+            for i2, pid2 in enumerate(self.pids):
+                sim_matrix[pid1][pid2] = row[i2]
+        return sim_matrix
+
+    def update_participant(self, datum):
+        """Re-encode one participant and recompute only its row and column, O(n)."""
+        i = self.index[datum["id"]]
+        feature_rows = []
+        for feature in SIMILARITY_FEATURES:
+            columns = self.columns[feature]
+            X = self.matrices[feature]
+            values = feature_values(datum, feature)
+            new_columns = [v for v in dict.fromkeys(values) if v not in columns]
+            for category in new_columns:
+                columns[category] = len(columns)
+            if new_columns:
+                X = np.hstack([X, np.zeros((X.shape[0], len(new_columns)))])
+                self.matrices[feature] = X
+            X[i, :] = 0
+            X[i, [columns[v] for v in values]] = 1
+            intersection = X @ X[i]
+            sizes = X.sum(axis=1)
+            union = sizes + sizes[i] - intersection
+            with np.errstate(divide="ignore", invalid="ignore"):
+                feature_rows.append(np.where(union > 0, intersection / union, 0.0))
+        row = np.mean(np.stack(feature_rows), axis=0)
+        self.similarity[i, :] = row
+        self.similarity[:, i] = row
+        self._nearest = None
+        self._encoded = {}
+        return row
@@ -0,0 +1,174 @@
+import os
+from bisect import insort
+from .local import (
+    read_metadata,
+    read_participant_data,
+    read_participant_metadata_file,
+)
+from .loader import load_data
+from .pack import pack_is_fresh, load_pack
+from .post_process import prepareParticipantData
+from .similarity import SimilarityEngine, SIMILARITY_FEATURES, feature_values
+from .bitmap import CategoryIndex
+
+SECTIONS = ["background", "drivers_of_change", "future_management", "decision_making"]
+
+
+def category_keys(datum):
+    return [
+        feature + "-" + category
+        for feature in SIMILARITY_FEATURES
+        for category in feature_values(datum, feature)
+    ]
+
+
+class FlowState:
+    """
+    Everything served by /api/flow/data/, plus what is needed to patch it
+    after a single participant's files change without a full reload.
+    """
+
+    def __init__(self, metadata_path, data_path, pack_path=None):
+        self.metadata_path = metadata_path
+        self.data_path = data_path
+        if pack_path is not None and pack_is_fresh(pack_path, metadata_path, data_path):
+            (
+                metadata,
+                background,
+                drivers_of_change,
+                future_management,
+                decision_making,
+                participant_metadata,
+                self.load_report,
+            ) = load_pack(pack_path)
+        else:
+            metadata = read_metadata(metadata_path)
+            (
+                background,
+                drivers_of_change,
+                future_management,
+                decision_making,
+                participant_metadata,
+                self.load_report,
+            ) = load_data(data_path)
+        participant_data, category_dict = prepareParticipantData(
+            background, drivers_of_change, future_management, decision_making
+        )
+        self.participant_metadata = participant_metadata
+        self.engine = SimilarityEngine(participant_data, category_dict)
+        # the four section lists are built in the same participant order
+        self.positions = {
+            entry["summary"]["id"]: position
+            for position, entry in enumerate(background)
+        }
+        self.payload = {
+            "background": background,
+            "drivers_of_change": drivers_of_change,
+            "future_management": future_management,
+            "decision_making": decision_making,
+            "metadata": metadata,
+            "participant_data": participant_data,
+            "category_dict": category_dict,
+            "similarities": self.engine.to_dict(),
+        }
+        # derived views of the payload, dropped whenever it is patched
+        self.views = {}
+
+    def slim_payload(self):
+        """The payload without conversation transcripts."""
+        if "slim" not in self.views:
+            slim = dict(self.payload)
+            for section in SECTIONS:
+                slim[section] = [
+                    {
+                        key: value
+                        for key, value in entry.items()
+                        if key != "conversation"
+                    }
+                    for entry in self.payload[section]
+                ]
+            slim["participant_data"] = {
+                pid: {
+                    key: value for key, value in datum.items() if key != "conversations"
+                }
+                for pid, datum in self.payload["participant_data"].items()
+            }
+            self.views["slim"] = slim
+        return self.views["slim"]
+
+    def category_index(self):
+        if "category_index" not in self.views:
+            self.views["category_index"] = CategoryIndex(
+                self.engine.pids, self.payload["category_dict"]
+            )
+        return self.views["category_index"]
+
+    def conversation(self, pid, section):
+        return self.payload["participant_data"][pid]["conversations"][section]
+
+    def apply_changes(self, changed_paths):
+        """
+        Patch the state for modified files. Returns False when a change
+        cannot be applied incrementally and a full reload is needed.
+        """
+        self.views = {}
+        data_dir = os.path.normpath(self.data_path)
+        participant_metadata_dir = os.path.normpath(self.data_path + "metadata/")
+        metadata_dir = os.path.normpath(self.metadata_path)
+        participants = set()
+        reload_metadata = False
+        for filepath in changed_paths:
+            directory = os.path.dirname(os.path.normpath(filepath))
+            if directory == data_dir:
+                participants.add(os.path.basename(filepath).replace(".json", ""))
+            elif directory == participant_metadata_dir:
+                p_metadata = read_participant_metadata_file(filepath)
+                participant = p_metadata["Interviewee"]
+                self.participant_metadata[participant] = p_metadata
+                participants.add(participant)
+            elif directory == metadata_dir:
+                reload_metadata = True
+            else:
+                return False
+        if reload_metadata:
+            self.payload["metadata"] = read_metadata(self.metadata_path)
+        for participant in participants:
+            if not self.update_participant(participant):
+                return False
+        return True
+
+    def matches_rebuild(self):
+        """True when the payload equals one loaded from scratch."""
+        return self.payload == FlowState(self.metadata_path, self.data_path).payload
+
+    def update_participant(self, participant):
+        sections = read_participant_data(
+            self.data_path, participant, self.participant_metadata
+        )
+        pid = sections[0]["summary"]["id"]
+        if pid not in self.positions:
+            return False
+        position = self.positions[pid]
+        for section, entry in zip(SECTIONS, sections):
+            self.payload[section][position] = entry
+
+        participant_data = self.payload["participant_data"]
+        category_dict = self.payload["category_dict"]
+        new_participant_data, _ = prepareParticipantData(*[[s] for s in sections])
+        for key in category_keys(participant_data[pid]):
+            if key in category_dict:
+                category_dict[key] = [p for p in category_dict[key] if p != pid]
+                if len(category_dict[key]) == 0:
+                    del category_dict[key]
+        participant_data[pid] = new_participant_data[pid]
+        # once per occurrence: prepareParticipantData lists a pid under a key
+        # as often as it has that category
+        for key in category_keys(participant_data[pid]):
+            insort(category_dict[key], pid, key=self.positions.get)
+
+        row = self.engine.update_participant(participant_data[pid])
+        similarities = self.payload["similarities"]
+        for other, score in zip(self.engine.pids, row):
+            similarities[pid][other] = score
+            similarities[other][pid] = score
+        return True
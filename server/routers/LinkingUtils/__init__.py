@@ -0,0 +1,4 @@
+from .trie import *
+from .scenarios import *
+from .search import *
+from .summaries import *
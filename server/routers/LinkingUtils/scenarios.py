@@ -0,0 +1,113 @@
+import json
+import threading
+from ..FlowDBUtils.cache import SnapshotCache
+from .trie import CodeTrie
+
+
+class ScenarioResponses:
+    """
+    scenarios/codes_manual/ responses for one version of the source files.
+
+    Each scenario is built on first request and then kept, already
+    encoded by `encode`, until the files change. Different scenarios can
+    be built concurrently; a scenario is built only once.
+    """
+
+    def __init__(self, scenario_codes, trie, encode):
+        self.scenario_codes = scenario_codes
+        self.trie = trie
+        self.encode = encode
+        self.lock = threading.Lock()
+        self.scenario_locks = {}
+        self.responses = {}
+
+    def __contains__(self, scenario):
+        return scenario in self.scenario_codes
+
+    def get(self, scenario):
+        with self.lock:
+            scenario_lock = self.scenario_locks.setdefault(scenario, threading.Lock())
+        with scenario_lock:
+            if scenario not in self.responses:
+                self.responses[scenario] = self.encode(
+                    build_scenario_codes(self.scenario_codes[scenario], self.trie)
+                )
+            return self.responses[scenario]
+
+
+def load_scenario_responses(scenario_codes_path, code_freq_path, encode):
+    with open(scenario_codes_path, encoding="utf-8") as f:
+        scenario_codes = json.load(f)
+    with open(code_freq_path, encoding="utf-8") as f:
+        code_freq = json.load(f)
+    return ScenarioResponses(scenario_codes, CodeTrie(code_freq), encode)
+
+
+def scenario_response_cache(scenario_codes_path, code_freq_path, encode):
+    return SnapshotCache(
+        lambda: load_scenario_responses(scenario_codes_path, code_freq_path, encode),
+        [scenario_codes_path, code_freq_path],
+    )
+
+
+def build_scenario_codes(codes, trie):
+    view = trie.scenario(codes)
+    code_w_freq = [
+        {"code_name": code, "occurrences": view.references_count(code)}
+        for code in view.leaves
+    ]
+    return {
+        "occurrences": code_w_freq,
+        "participants": [view.node(name) for name in view.preorder()],
+    }
+
+
+def build_scenario_comparison(scenarios, scenario_codes, trie):
+    """
+    Codes and occurrences of each scenario, and for every pair of scenarios
+    the codes and participants they share, from one pass over the trie.
+    """
+    views = {
+        scenario: trie.scenario(scenario_codes[scenario]) for scenario in scenarios
+    }
+    res = {}
+    for scenario, view in views.items():
+        res[scenario] = {
+            "occurrences": [
+                {"code_name": code, "occurrences": view.references_count(code)}
+                for code in view.leaves
+            ],
+            "participants": trie.ids(view.participant_bits()),
+            "references_count": view.references_count(),
+        }
+    overlaps = []
+    for i, source in enumerate(scenarios):
+        for target in scenarios[i + 1 :]:
+            source_codes = set(views[source].leaves)
+            target_codes = set(views[target].leaves)
+            shared_codes = source_codes & target_codes
+            source_bits = views[source].participant_bits()
+            target_bits = views[target].participant_bits()
+            shared_bits = source_bits & target_bits
+            overlaps.append(
+                {
+                    "source": source,
+                    "target": target,
+                    "shared_codes": [
+                        c for c in views[source].leaves if c in shared_codes
+                    ],
+                    "code_jaccard": jaccard(
+                        len(shared_codes), len(source_codes | target_codes)
+                    ),
+                    "shared_participants": trie.ids(shared_bits),
+                    "participant_jaccard": jaccard(
+                        bin(shared_bits).count("1"),
+                        bin(source_bits | target_bits).count("1"),
+                    ),
+                }
+            )
+    return {"scenarios": res, "overlaps": overlaps}
+
+
+def jaccard(intersection, union):
+    return intersection / union if union > 0 else 0.0
@@ -0,0 +1,144 @@
+import bisect
+import math
+import re
+import threading
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+PARTICIPANT_PATTERN = re.compile(r"Files\\\\([A-Z]+) Transcript")
+
+
+def tokenize(text):
+    return [token.lower() for token in WORD_PATTERN.findall(text)]
+
+
+def participant_short_id(participant):
+    match = PARTICIPANT_PATTERN.search(participant)
+    return match.group(1) if match else "unknown"
+
+
+class ReferenceIndex:
+    """
+    Inverted index over the reference texts of the codes in a CodeTrie.
+
+    References are numbered in preorder of the code trie, so the references
+    of a code subtree are one contiguous range of ids and the subtree
+    filter is a range check.
+    """
+
+    def __init__(self, trie):
+        self.trie = trie
+        self.codes = []
+        self.positions = []
+        self.code_rank = {}
+        self.postings = {}
+        ranks = []
+        for rank, node in enumerate(self.trie.preorder(self.trie.root)):
+            self.code_rank[node.name] = rank
+            if node.entry is None:
+                continue
+            for position, reference in enumerate(node.entry["references"]):
+                doc = len(self.codes)
+                self.codes.append(node.name)
+                self.positions.append(position)
+                ranks.append(rank)
+                for token in tokenize(reference["reference"]):
+                    postings = self.postings.setdefault(token, {})
+                    postings[doc] = postings.get(doc, 0) + 1
+        # last preorder rank in each subtree, then the matching id range
+        ends = {}
+        for node in reversed(list(self.trie.preorder(self.trie.root))):
+            last = self.code_rank[node.name]
+            for child in node.children.values():
+                last = max(last, ends[child.name])
+            ends[node.name] = last
+        self.subtree_end = {
+            name: bisect.bisect_right(ranks, last) for name, last in ends.items()
+        }
+        self.subtree_start = {
+            name: bisect.bisect_left(ranks, rank)
+            for name, rank in self.code_rank.items()
+        }
+
+    def __len__(self):
+        return len(self.codes)
+
+    def reference(self, doc):
+        return self.trie.nodes[self.codes[doc]].entry["references"][self.positions[doc]]
+
+    def search(self, query, code=None):
+        """
+        Ids of the references containing every word of `query`, best
+        (summed tf-idf) first, optionally only under the `code` subtree.
+        Raises KeyError for an unknown code.
+        """
+        if code is not None and code not in self.trie.nodes:
+            raise KeyError(code)
+        terms = list(dict.fromkeys(tokenize(query)))
+        if len(terms) == 0:
+            return [], terms
+        postings = [self.postings.get(term, {}) for term in terms]
+        postings.sort(key=len)
+        if len(postings[0]) == 0:
+            # a word that occurs nowhere, nothing contains every word
+            return [], terms
+        docs = postings[0].keys()
+        if code is not None:
+            start, end = self.subtree_start[code], self.subtree_end[code]
+            docs = [doc for doc in docs if start <= doc < end]
+        for other in postings[1:]:
+            docs = [doc for doc in docs if doc in other]
+        scores = {}
+        for term_postings in postings:
+            if len(term_postings) == 0:
+                continue
+            idf = math.log(1 + len(self.codes) / len(term_postings))
+            for doc in docs:
+                scores[doc] = scores.get(doc, 0) + term_postings[doc] * idf
+        return sorted(docs, key=lambda doc: (-scores[doc], doc)), terms
+
+    def snippet(self, text, terms, width=80):
+        """
+        About `width` characters of `text` around the first matched term,
+        with the [start, end) offsets of every matched word in the snippet.
+        """
+        matches = [
+            m for m in WORD_PATTERN.finditer(text) if m.group(0).lower() in terms
+        ]
+        first = matches[0].start() if len(matches) > 0 else 0
+        start = max(0, first - width // 2)
+        end = min(len(text), start + width)
+        start = max(0, min(start, end - width))
+        # do not cut words at either end
+        while start > 0 and text[start - 1].isalnum():
+            start -= 1
+        while end < len(text) and text[end].isalnum():
+            end += 1
+        prefix = "..." if start > 0 else ""
+        suffix = "..." if end < len(text) else ""
+        highlights = [
+            [m.start() - start + len(prefix), m.end() - start + len(prefix)]
+            for m in matches
+            if start <= m.start() and m.end() <= end
+        ]
+        return prefix + text[start:end] + suffix, highlights
+
+
+class ReferenceIndexCache:
+    """
+    The ReferenceIndex of the trie returned by `get_trie`, rebuilt only when
+    that returns a different trie, i.e. when code_freq.json changed.
+    """
+
+    def __init__(self, get_trie):
+        self.get_trie = get_trie
+        self.lock = threading.Lock()
+        self.trie = None
+        self.index = None
+
+    def get(self):
+        trie = self.get_trie()
+        with self.lock:
+            if trie is not self.trie:
+                self.index = ReferenceIndex(trie)
+                self.trie = trie
+            return self.index
@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import json
+import os
+from ..FlowDBUtils.cache import SnapshotCache
+from ..FlowDBUtils.local import save_json
+from .search import participant_short_id
+
+SUMMARY_MODEL = "gpt-4o-mini"
+
+# generations allowed to run at once, across all requests
+MAX_CONCURRENT_GENERATIONS = 4
+
+SUMMARY_PROMPT = """
+            Summarize the references for me in a concise way. Use only one short sentence for each bullet point.
+            Give me no more than 5 bullet points.
+            References: {references_text}
+            """
+
+REFERENCE_TEMPLATE = """
+        <reference>
+            <reference_text> {reference} </reference_text>
+            <from_participant> {participant} </from_participant>
+        </reference
+        """
+
+
+def load_code_summaries(code_summaries_path):
+    with open(code_summaries_path, encoding="utf-8") as f:
+        return {item["name"]: item["summary"] for item in json.load(f)}
+
+
+def code_summaries_cache(code_summaries_path):
+    return SnapshotCache(
+        lambda: load_code_summaries(code_summaries_path), [code_summaries_path]
+    )
+
+
+def summary_messages(references):
+    references_text = ""
+    for ref in references:
+        references_text += REFERENCE_TEMPLATE.format(
+            reference=ref["reference"],
+            participant=participant_short_id(ref["participant"]),
+        )
+    return [
+        {
+            "source": "user",
+            "content": SUMMARY_PROMPT.format(references_text=references_text),
+        }
+    ]
+
+
+def summary_key(references):
+    """sha256 of everything the generated summary depends on."""
+    body = json.dumps(
+        {
+            "model": SUMMARY_MODEL,
+            "prompt": SUMMARY_PROMPT,
+            "reference_template": REFERENCE_TEMPLATE,
+            "references": [[r["participant"], r["reference"]] for r in references],
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def openai_api_key(api_key_path="api_key"):
+    if os.environ.get("OPENAI_API_KEY"):
+        return os.environ["OPENAI_API_KEY"]
+    if os.path.exists(api_key_path):
+        with open(api_key_path) as f:
+            return f.read().strip()
+    raise RuntimeError("set OPENAI_API_KEY to generate code summaries")
+
+
+async def generate_summary(references):
+    # the LLM dependencies are only needed when a summary is generated
+    from ..AutoGenUtils import query
+
+    response, _ = await query.chat(
+        summary_messages(references), SUMMARY_MODEL, openai_api_key(), temperature=1
+    )
+    return response
+
+
+class SummaryCache:
+    """
+    Generated code summaries, one JSON file per summary_key in `cache_dir`.
+
+    Identical references under the same prompt share one file, so each
+    summary is generated at most once, also across restarts. Concurrent
+    requests for the same key wait for the first generation, and at most
+    `max_concurrent` generations run at a time. File reads and writes run
+    in worker threads so they do not block the event loop.
+    """
+
+    def __init__(
+        self,
+        cache_dir,
+        generate=generate_summary,
+        max_concurrent=MAX_CONCURRENT_GENERATIONS,
+    ):
+        self.cache_dir = cache_dir
+        self.generate = generate
+        self.locks = {}
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def store(self, key, summary):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        save_json({"summary": summary}, self.path(key))
+
+    def lookup(self, key):
+        try:
+            with open(self.path(key), encoding="utf-8") as f:
+                return json.load(f)["summary"]
+        except FileNotFoundError:
+            return None
+
+    async def get(self, references):
+        key = summary_key(references)
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            summary = await asyncio.to_thread(self.lookup, key)
+            if summary is None:
+                async with self.semaphore:
+                    summary = await self.generate(references)
+                await asyncio.to_thread(self.store, key, summary)
+        self.locks.pop(key, None)
+        return summary
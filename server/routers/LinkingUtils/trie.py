@@ -0,0 +1,171 @@
+from types import MappingProxyType
+
+SEPARATOR = "\\"
+
+
+class CodeNode:
+    """
+    One `\\`-separated prefix of the code paths. `entry` is the code_freq
+    entry for the path, None for a prefix that is not a code itself.
+    """
+
+    __slots__ = (
+        "name",
+        "parent",
+        "children",
+        "entry",
+        "participants",
+        "references",
+    )
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.children = {}
+        self.entry = None
+        # participant bitset and reference count of the code itself
+        self.participants = 0
+        self.references = 0
+
+
+class CodeTrie:
+    """
+    Trie over the code paths of code_freq.json, built once per file version.
+
+    Participants are bits of Python ints over participant ordinals, so the
+    participant union of any set of nodes is a sequence of ORs.
+
+    The trie is shared by concurrent requests and read-only once built:
+    entries and children are exposed as read-only mappings, and anything
+    request-specific lives in a ScenarioView.
+    """
+
+    def __init__(self, code_freq):
+        self.participant_names = []
+        self.ordinal = {}
+        self.root = CodeNode("root")
+        self.nodes = {}
+        for code in code_freq:
+            node = self.insert(code["name"])
+            node.entry = MappingProxyType(dict(code))
+            for reference in code["references"]:
+                node.participants |= self.participant_bit(reference["participant"])
+            node.references = len(code["references"])
+        for node in self.preorder(self.root):
+            node.children = MappingProxyType(node.children)
+
+    def participant_bit(self, participant):
+        if participant not in self.ordinal:
+            self.ordinal[participant] = len(self.participant_names)
+            self.participant_names.append(participant)
+        return 1 << self.ordinal[participant]
+
+    def insert(self, path):
+        node = self.root
+        segments = path.split(SEPARATOR)
+        for i, segment in enumerate(segments):
+            if segment not in node.children:
+                name = SEPARATOR.join(segments[: i + 1])
+                node.children[segment] = CodeNode(name, node)
+                self.nodes[name] = node.children[segment]
+            node = node.children[segment]
+        return node
+
+    def preorder(self, node):
+        stack = [node]
+        while len(stack) > 0:
+            current = stack.pop()
+            yield current
+            stack.extend(reversed(list(current.children.values())))
+
+    def ids(self, bits):
+        res = []
+        while bits:
+            lowest = bits & -bits
+            res.append(self.participant_names[lowest.bit_length() - 1])
+            bits ^= lowest
+        return res
+
+    def is_code(self, path):
+        return path in self.nodes and self.nodes[path].entry is not None
+
+    def leaves(self, codes):
+        """
+        The distinct codes of `codes` that are codes in the trie and not an
+        ancestor of another selected code, in their original order.
+        """
+        selected = [c for c in dict.fromkeys(codes) if self.is_code(c)]
+        covered = set()
+        for code in selected:
+            node = self.nodes[code].parent
+            while node is not self.root and node.name not in covered:
+                covered.add(node.name)
+                node = node.parent
+        return [c for c in selected if c not in covered]
+
+    def prune(self, leaves):
+        """
+        The subtree spanned by the root and `leaves`. Counts come from the
+        leaves' own references, as codes_manual/ has always reported them,
+        and are summed bottom-up over the pruned tree only.
+        """
+        pruned = {self.root.name: [[], 0, 0]}
+        for leaf in leaves:
+            node = self.nodes[leaf]
+            bits, references = node.participants, node.references
+            pruned[leaf] = [[], bits, references]
+            while node is not self.root:
+                parent = node.parent
+                if parent.name not in pruned:
+                    pruned[parent.name] = [[], 0, 0]
+                summary = pruned[parent.name]
+                if node.name not in summary[0]:
+                    summary[0].append(node.name)
+                summary[1] |= bits
+                summary[2] += references
+                node = parent
+        return ScenarioView(self, leaves, pruned)
+
+    def scenario(self, codes):
+        return self.prune(self.leaves(codes))
+
+
+class ScenarioView:
+    """
+    One scenario's pruned subtree of a shared CodeTrie: the selected leaf
+    codes and, per node, its children in the subtree, participant bits and
+    reference count. The view never writes to the trie.
+    """
+
+    def __init__(self, trie, leaves, pruned):
+        self.trie = trie
+        self.leaves = leaves
+        self.pruned = pruned
+
+    def __contains__(self, name):
+        return name in self.pruned
+
+    def children(self, name):
+        return self.pruned[name][0]
+
+    def participant_bits(self, name=None):
+        return self.pruned[name or self.trie.root.name][1]
+
+    def references_count(self, name=None):
+        return self.pruned[name or self.trie.root.name][2]
+
+    def preorder(self):
+        stack = [self.trie.root.name]
+        while len(stack) > 0:
+            name = stack.pop()
+            yield name
+            stack.extend(reversed(self.children(name)))
+
+    def node(self, name):
+        """The code_freq entry of `name` with this scenario's aggregates."""
+        entry = self.trie.nodes[name].entry if name in self.trie.nodes else None
+        node = dict(entry) if entry is not None else {"name": name}
+        node["scenario_children"] = list(self.children(name))
+        node["participants"] = self.trie.ids(self.participant_bits(name))
+        node["references_count"] = self.references_count(name)
+        return node
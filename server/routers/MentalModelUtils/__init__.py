@@ -0,0 +1,8 @@
+from .codebook import *
+from .index import *
+from .columns import *
+from .aggregate import *
+from .submissions import *
+from .live import *
+from .cluster import *
+from .layout import *
@@ -0,0 +1,71 @@
+import numpy as np
+
+
+class Incidence:
+    """Binary participant x code matrix of which participant mentioned which code."""
+
+    def __init__(self, participant_ids, code_participants):
+        self.participant_ids = list(participant_ids)
+        self.code_names = list(code_participants)
+        ordinal = {pid: i for i, pid in enumerate(self.participant_ids)}
+        self.matrix = np.zeros(
+            (len(self.participant_ids), len(self.code_names)), dtype=bool
+        )
+        for j, code_name in enumerate(self.code_names):
+            for pid in code_participants[code_name]:
+                self.matrix[ordinal[pid], j] = True
+
+    def rollup(self, parent_of):
+        """Participant x parent-code matrix: a parent is mentioned if any child is."""
+        parents = list(dict.fromkeys(parent_of(c) for c in self.code_names))
+        parent_index = {parent: i for i, parent in enumerate(parents)}
+        membership = np.zeros((len(self.code_names), len(parents)), dtype=np.int64)
+        for j, code_name in enumerate(self.code_names):
+            membership[j, parent_index[parent_of(code_name)]] = 1
+        return parents, (self.matrix.astype(np.int64) @ membership) > 0
+
+    def summarize(self, matrix, names):
+        """{name: {participants, count}} for the columns of a participant x name matrix."""
+        res = {}
+        for j, name in enumerate(names):
+            rows = np.flatnonzero(matrix[:, j])
+            res[name] = {
+                "participants": [self.participant_ids[i] for i in rows],
+                "count": len(rows),
+            }
+        return res
+
+    def cooccurrence(self):
+        """Code x code counts of participants mentioning both codes (diagonal: each code)."""
+        X = self.matrix.astype(np.int64)
+        return X.T @ X
+
+    def cooccurrence_scores(self, counts, score):
+        """`lift` (observed / expected joint frequency) or `jaccard`, 0 where undefined."""
+        single = np.diag(counts).astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if score == "lift":
+                scores = counts * len(self.participant_ids) / np.outer(single, single)
+            elif score == "jaccard":
+                scores = counts / (single[:, None] + single[None, :] - counts)
+            else:
+                raise ValueError("unknown score '{}'".format(score))
+        return np.nan_to_num(scores, nan=0.0, posinf=0.0)
+
+
+def top_pairs(counts, scores, n):
+    """The n code pairs (i < j) that co-occur at least once, best `scores` first."""
+    rows, cols = np.triu_indices(counts.shape[0], k=1)
+    keep = counts[rows, cols] > 0
+    rows, cols = rows[keep], cols[keep]
+    values = scores[rows, cols]
+    if n < len(values):
+        selected = np.argpartition(-values, n - 1)[:n]
+    else:
+        selected = np.arange(len(values))
+    # best first, ties broken by count then position
+    order = np.lexsort(
+        (selected, -counts[rows[selected], cols[selected]], -values[selected])
+    )
+    selected = selected[order]
+    return rows[selected], cols[selected]
@@ -0,0 +1,100 @@
+import numpy as np
+from ..FlowDBUtils.similarity import jaccard_matrix
+
+SIMILARITY_METRICS = ["jaccard", "cosine"]
+
+
+def cosine_matrix(X):
+    """Pairwise cosine of the rows of a binary matrix, 0 for empty rows."""
+    X = np.asarray(X, dtype=np.float64)
+    norms = np.sqrt(X.sum(axis=1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sims = (X @ X.T) / np.outer(norms, norms)
+    return np.nan_to_num(sims, nan=0.0, posinf=0.0)
+
+
+def participant_similarity(incidence, metric):
+    if metric == "jaccard":
+        return jaccard_matrix(incidence.matrix)
+    if metric == "cosine":
+        return cosine_matrix(incidence.matrix)
+    raise ValueError("unknown metric '{}'".format(metric))
+
+
+def average_linkage(distance):
+    """
+    Agglomerative clustering with average linkage (UPGMA).
+
+    Returns the merges as (cluster a, cluster b, distance, size) rows in
+    the scipy linkage layout: leaves are 0..n-1 and the cluster formed by
+    merge k is n + k.
+    """
+    n = distance.shape[0]
+    D = np.array(distance, dtype=np.float64)
+    np.fill_diagonal(D, np.inf)
+    sizes = np.ones(n, dtype=np.int64)
+    ids = np.arange(n)
+    active = np.ones(n, dtype=bool)
+    merges = []
+    for k in range(n - 1):
+        flat = np.argmin(D)
+        i, j = divmod(flat, n)
+        if i > j:
+            i, j = j, i
+        a, b = sorted((int(ids[i]), int(ids[j])))
+        merges.append((a, b, float(D[i, j]), int(sizes[i] + sizes[j])))
+        # Lance-Williams update for average linkage, merged cluster kept in row i
+        merged = (sizes[i] * D[i] + sizes[j] * D[j]) / (sizes[i] + sizes[j])
+        D[i, :] = merged
+        D[:, i] = merged
+        D[i, i] = np.inf
+        D[j, :] = np.inf
+        D[:, j] = np.inf
+        D[i, ~active] = np.inf
+        D[~active, i] = np.inf
+        active[j] = False
+        sizes[i] += sizes[j]
+        ids[i] = n + k
+    return merges
+
+
+def cut_linkage(merges, n, k=None, threshold=None):
+    """
+    Flat cluster labels from `merges`: stop at `k` clusters, or merge only
+    below a distance `threshold`. Labels are numbered by first member.
+    """
+    parent = list(range(2 * n - 1))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for step, (a, b, dist, _) in enumerate(merges):
+        if k is not None and step >= n - k:
+            break
+        if threshold is not None and dist > threshold:
+            break
+        parent[find(a)] = n + step
+        parent[find(b)] = n + step
+    labels = {}
+    return [labels.setdefault(find(i), len(labels)) for i in range(n)]
+
+
+def representative_codes(incidence, members, top):
+    """Codes most prevalent among `members`, with their lift over everyone."""
+    if len(members) == 0 or incidence.matrix.shape[1] == 0:
+        return []
+    overall = incidence.matrix.mean(axis=0)
+    prevalence = incidence.matrix[members].mean(axis=0)
+    order = np.lexsort((-overall, -prevalence))[:top]
+    return [
+        {
+            "code": incidence.code_names[j],
+            "prevalence": float(prevalence[j]),
+            "lift": float(prevalence[j] / overall[j]) if overall[j] > 0 else 0.0,
+        }
+        for j in order
+        if prevalence[j] > 0
+    ]
@@ -0,0 +1,56 @@
+import hashlib
+import json
+import threading
+from functools import cached_property
+from ..FlowDBUtils.cache import SnapshotCache
+
+
+class Codebook:
+    """Lookups over an all_codes.json list, built once per file version."""
+
+    def __init__(self, codes):
+        self.codes = codes
+        self.by_name = {}
+        for code in codes:
+            # first definition wins, as with a linear search
+            self.by_name.setdefault(code.get("name"), code)
+        self.parent_dict = {
+            name: code.get("parent", "N/A") for name, code in self.by_name.items()
+        }
+        self.type_dict = {
+            name: code.get("type", "Unknown") for name, code in self.by_name.items()
+        }
+        self.names = frozenset(self.by_name)
+
+    @cached_property
+    def digest(self):
+        """sha256 of the codebook content, independent of file metadata."""
+        body = json.dumps(self.codes, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+    def parent_or_self(self, code_name):
+        parent = self.parent_dict[code_name]
+        return parent if parent != "N/A" else code_name
+
+
+def load_codebook(codebook_path):
+    with open(codebook_path, "r", encoding="utf-8") as f:
+        return Codebook(json.load(f))
+
+
+_codebook_caches = {}
+_codebook_caches_lock = threading.Lock()
+
+
+def get_shared_codebook(codebook_path):
+    """
+    The process-wide Codebook for a file, reloaded when the file changes.
+    Callers must treat it as read-only.
+    """
+    with _codebook_caches_lock:
+        if codebook_path not in _codebook_caches:
+            _codebook_caches[codebook_path] = SnapshotCache(
+                lambda: load_codebook(codebook_path), [codebook_path]
+            )
+        cache = _codebook_caches[codebook_path]
+    return cache.get()
@@ -0,0 +1,72 @@
+import numpy as np
+from .index import QUALITY_CRITERIA
+
+
+class EntryColumns:
+    """
+    Mental model entries of all participants laid out as columns.
+
+    Every quality criterion is a precomputed boolean column over all
+    entries, so any combination of criteria is one vectorized mask AND.
+    """
+
+    def __init__(self, participants):
+        self.participant_ids = [pid for pid, _ in participants]
+        self.entries = [entry for _, entries in participants for entry in entries]
+        lengths = [len(entries) for _, entries in participants]
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(int)
+        self.participant = np.repeat(np.arange(len(lengths)), lengths)
+        self.code_names = list(dict.fromkeys(e["code_name"] for e in self.entries))
+        code_ids = {name: i for i, name in enumerate(self.code_names)}
+        self.code = np.array(
+            [code_ids[e["code_name"]] for e in self.entries], dtype=int
+        )
+        self.criteria = {
+            criterion: np.array(
+                [e.get(criterion) == "Good" for e in self.entries], dtype=bool
+            )
+            for criterion in QUALITY_CRITERIA
+        }
+
+    def mask(self, criteria):
+        mask = np.ones(len(self.entries), dtype=bool)
+        for criterion in criteria:
+            mask &= self.criteria[criterion]
+        return mask
+
+    def participants(self, criteria):
+        """(participant id, entries passing `criteria`) in participant order."""
+        mask = self.mask(criteria)
+        res = []
+        for i, pid in enumerate(self.participant_ids):
+            start, end = self.offsets[i], self.offsets[i + 1]
+            selected = np.flatnonzero(mask[start:end]) + start
+            res.append((pid, [self.entries[j] for j in selected]))
+        return res
+
+    def code_participants(self, criteria):
+        """Code name -> ids of the participants with a passing entry for it."""
+        mask = self.mask(criteria)
+        n = len(self.participant_ids)
+        pairs = np.unique(self.code[mask] * max(n, 1) + self.participant[mask])
+        res = {}
+        for code, participant in zip(pairs // max(n, 1), pairs % max(n, 1)):
+            res.setdefault(self.code_names[code], []).append(
+                self.participant_ids[participant]
+            )
+        return res
+
+
+def parse_criteria(criteria):
+    """
+    Comma-separated criteria from a query parameter. None selects all of
+    them, an empty string none. Raises ValueError on an unknown name.
+    """
+    if criteria is None:
+        return tuple(QUALITY_CRITERIA)
+    selected = [c.strip() for c in criteria.split(",") if c.strip() != ""]
+    unknown = [c for c in selected if c not in QUALITY_CRITERIA]
+    if unknown:
+        raise ValueError("unknown quality criteria {}".format(unknown))
+    # canonical order so equal selections share one cached view
+    return tuple(c for c in QUALITY_CRITERIA if c in selected)
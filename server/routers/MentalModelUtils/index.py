@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+from ..FlowDBUtils.cache import file_signature
+
+QUALITY_CRITERIA = [
+    "logical_connection",
+    "significance",
+    "relevance",
+    "inference",
+    "interpretation",
+    "preciseness",
+]
+
+
+def prefilter_interview_mm(participant_MM, codebook):
+    """
+    Entries in the codebook that are mentioned and have an impact. The
+    quality criteria are applied per request, see EntryColumns.
+    """
+    participant_MM = [x for x in participant_MM if x["code_name"] in codebook.names]
+    participant_MM = [x for x in participant_MM if x["mentioned"]]
+    participant_MM = [x for x in participant_MM if x["impact"]]
+    return participant_MM
+
+
+class MentalModelIndex:
+    """
+    Filtered mental models of every participant file matching `pattern`.
+
+    `refresh` reparses only files that were added or changed since the last
+    call and re-filters everything only when the codebook was reloaded.
+    Responses derived from the index are memoized with `view` until the
+    next change.
+    """
+
+    def __init__(self, pattern, filter_entries):
+        self.pattern = pattern
+        self.filter_entries = filter_entries
+        # re-entrant so a view can be built from other views
+        self.lock = threading.RLock()
+        self.codebook = None
+        self.signature = {}
+        self.raw = {}
+        self.filtered = {}
+        self.order = []
+        self.version = 0
+        self.views = {}
+
+    def refresh(self, codebook):
+        signature = file_signature([self.pattern])
+        with self.lock:
+            changed = codebook is not self.codebook or list(signature) != self.order
+            for filepath, file_stat in signature.items():
+                if self.signature.get(filepath) != file_stat:
+                    with open(filepath, "r") as f:
+                        self.raw[filepath] = json.load(f)
+                    self.filtered[filepath] = self.filter_entries(
+                        self.raw[filepath], codebook
+                    )
+                    changed = True
+            for filepath in set(self.raw) - set(signature):
+                del self.raw[filepath]
+                del self.filtered[filepath]
+            if codebook is not self.codebook:
+                for filepath in signature:
+                    self.filtered[filepath] = self.filter_entries(
+                        self.raw[filepath], codebook
+                    )
+                self.codebook = codebook
+            self.signature = signature
+            self.order = list(signature)
+            if changed:
+                self.version += 1
+                self.views = {}
+        return self
+
+    def participants(self):
+        """(participant id, filtered entries) in file order."""
+        return [
+            (participant_id(filepath), self.filtered[filepath])
+            for filepath in self.order
+        ]
+
+    def view(self, name, build):
+        with self.lock:
+            if name not in self.views:
+                self.views[name] = build(self)
+            return self.views[name]
+
+
+def participant_id(filepath):
+    return os.path.basename(filepath).split(".")[0]
+
+
+def filter_exhibition_mm(participant_MM, codebook):
+    """Entries whose code is in the codebook."""
+    return [x for x in participant_MM if x["code_name"] in codebook.names]
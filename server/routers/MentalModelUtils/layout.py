@@ -0,0 +1,141 @@
+import re
+import threading
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+LAYOUT_MARGIN = 0.05
+
+
+def parent_documents(codebook):
+    """{parent code: names and definitions of the parent and its children}"""
+    documents = {}
+    for name, code in codebook.by_name.items():
+        parent = codebook.parent_or_self(name)
+        text = documents.setdefault(parent, [parent])
+        text += [name, code.get("definition") or ""]
+    return {parent: " ".join(text) for parent, text in documents.items()}
+
+
+def text_similarity(documents):
+    """Cosine similarity of the TF-IDF vectors of `documents`."""
+    tokens = [TOKEN_PATTERN.findall(doc.lower()) for doc in documents]
+    vocabulary = {}
+    for doc_tokens in tokens:
+        for token in doc_tokens:
+            vocabulary.setdefault(token, len(vocabulary))
+    tf = np.zeros((len(documents), len(vocabulary)))
+    for i, doc_tokens in enumerate(tokens):
+        for token in doc_tokens:
+            tf[i, vocabulary[token]] += 1
+    idf = np.log((1 + len(documents)) / (1 + (tf > 0).sum(axis=0))) + 1
+    X = tf * idf
+    norms = np.linalg.norm(X, axis=1)
+    norms[norms == 0] = 1
+    X /= norms[:, None]
+    return np.clip(X @ X.T, 0, 1)
+
+
+def spectral_order(similarity):
+    """Fiedler vector of the similarity graph, a good global 1-D start."""
+    n = similarity.shape[0]
+    if n < 3:
+        return np.arange(n, dtype=np.float64)
+    W = similarity.copy()
+    np.fill_diagonal(W, 0)
+    laplacian = np.diag(W.sum(axis=1)) - W
+    _, vectors = np.linalg.eigh(laplacian)
+    return vectors[:, 1]
+
+
+def smacof_1d(distance, x, max_iter=300, tol=1e-6):
+    """
+    Refine 1-D positions `x` towards `distance` by SMACOF (Guttman
+    transform) iterations, until the relative stress improvement < `tol`.
+    """
+    n = len(x)
+    if n < 2:
+        return x, 0
+    x = np.array(x, dtype=np.float64)
+    # start at the scale of the target distances
+    current = np.abs(x[:, None] - x[None, :])
+    if current.sum() > 0:
+        x *= distance.sum() / current.sum()
+    stress = np.inf
+    for iteration in range(1, max_iter + 1):
+        current = np.abs(x[:, None] - x[None, :])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            B = np.where(current > 0, -distance / current, 0.0)
+        np.fill_diagonal(B, 0)
+        np.fill_diagonal(B, -B.sum(axis=1))
+        x = B @ x / n
+        new_stress = ((np.abs(x[:, None] - x[None, :]) - distance) ** 2).sum() / 2
+        if stress - new_stress < tol * max(new_stress, 1e-12):
+            break
+        stress = new_stress
+    return x, iteration
+
+
+class ParentLayout:
+    """
+    1-D positions in (0, 1) of the parent codes of a codebook, placing
+    parents with similar definitions next to each other.
+
+    Layouts are cached by codebook digest. A changed codebook starts from
+    the previous layout: known parents keep their positions, new parents
+    start next to their most similar known parent, and only a short
+    refinement runs.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.layouts = {}
+        self.previous = None
+        self.last_run = None
+
+    def get(self, codebook):
+        digest = codebook.digest
+        with self.lock:
+            if digest not in self.layouts:
+                self.layouts[digest] = self.compute(codebook, digest)
+            return self.layouts[digest]
+
+    def compute(self, codebook, digest):
+        documents = parent_documents(codebook)
+        parents = list(documents)
+        similarity = text_similarity(list(documents.values()))
+        distance = 1 - similarity
+        np.fill_diagonal(distance, 0)
+
+        warm = self.previous is not None and any(
+            parent in self.previous for parent in parents
+        )
+        if warm:
+            x = self.warm_start(parents, similarity)
+            x, iterations = smacof_1d(distance, x, max_iter=50)
+        else:
+            x, iterations = smacof_1d(distance, spectral_order(similarity))
+        self.previous = dict(zip(parents, x))
+        self.last_run = {"digest": digest, "warm": warm, "iterations": iterations}
+
+        # kept inside (0, 1) so no parent sits at exactly 0, which the
+        # renderer treats as missing
+        if len(x) > 0 and x.max() > x.min():
+            x = LAYOUT_MARGIN + (1 - 2 * LAYOUT_MARGIN) * (x - x.min()) / (
+                x.max() - x.min()
+            )
+        else:
+            x = np.full(len(x), 0.5)
+        return {parent: float(v) for parent, v in zip(parents, x)}
+
+    def warm_start(self, parents, similarity):
+        known = [i for i, parent in enumerate(parents) if parent in self.previous]
+        x = np.zeros(len(parents))
+        for i in known:
+            x[i] = self.previous[parents[i]]
+        for i, parent in enumerate(parents):
+            if parent in self.previous:
+                continue
+            nearest = known[int(np.argmax(similarity[i, known]))]
+            x[i] = x[nearest]
+        return x
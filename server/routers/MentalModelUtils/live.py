@@ -0,0 +1,87 @@
+import threading
+from collections import Counter, defaultdict
+
+DEMOGRAPHIC_FIELDS = ["age", "deltaEngagement", "residence"]
+
+
+class LiveCounters:
+    """
+    Running per-code totals over public submissions, updated in O(codes of
+    one submission) as each submission arrives.
+
+    For every code it keeps how many submissions mention it (split into
+    impactFactors / impactedFactors) and the demographic breakdown of those
+    participants.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.participants = 0
+        self.demographics = {field: Counter() for field in DEMOGRAPHIC_FIELDS}
+        self.codes = defaultdict(
+            lambda: {
+                "count": 0,
+                "impact": 0,
+                "impacted": 0,
+                "demographics": {field: Counter() for field in DEMOGRAPHIC_FIELDS},
+            }
+        )
+
+    def add(self, submission):
+        mental_model = submission.get("mentalModel")
+        demographics = submission.get("demographics")
+        if not isinstance(demographics, dict):
+            demographics = {}
+        impact = factor_names(mental_model, "impactFactors")
+        impacted = factor_names(mental_model, "impactedFactors")
+        with self.lock:
+            self.participants += 1
+            for field in DEMOGRAPHIC_FIELDS:
+                self.demographics[field][demographics.get(field, "Unknown")] += 1
+            for code_name in impact | impacted:
+                counts = self.codes[code_name]
+                counts["count"] += 1
+                counts["impact"] += code_name in impact
+                counts["impacted"] += code_name in impacted
+                for field in DEMOGRAPHIC_FIELDS:
+                    counts["demographics"][field][
+                        demographics.get(field, "Unknown")
+                    ] += 1
+
+    def totals(self):
+        with self.lock:
+            return {
+                "participants": self.participants,
+                "demographics": {
+                    field: dict(counter) for field, counter in self.demographics.items()
+                },
+                "codes": {
+                    code_name: {
+                        "count": counts["count"],
+                        "impact": counts["impact"],
+                        "impacted": counts["impacted"],
+                        "demographics": {
+                            field: dict(counter)
+                            for field, counter in counts["demographics"].items()
+                        },
+                    }
+                    for code_name, counts in self.codes.items()
+                },
+            }
+
+
+def factor_names(mental_model, key):
+    """
+    Names of the factors listed under `key`. mentalModel is free-form, so
+    anything that is not a list of {"name": str} entries is skipped.
+    """
+    if not isinstance(mental_model, dict):
+        return set()
+    factors = mental_model.get(key)
+    if not isinstance(factors, list):
+        return set()
+    return {
+        f["name"]
+        for f in factors
+        if isinstance(f, dict) and isinstance(f.get("name"), str)
+    }
@@ -0,0 +1,194 @@
+import glob
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+SUBMISSIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    received_at TEXT NOT NULL,
+    body TEXT NOT NULL
+)
+"""
+
+
+class SubmissionStore:
+    """
+    Append-only log of mental model submissions in a local SQLite table.
+
+    `submit` hands the submission to a single writer thread and waits for
+    it to be committed. The writer drains everything queued meanwhile into
+    the same transaction (group commit), so a burst of submissions costs
+    one fsync per batch instead of one file per submission. Every
+    submission gets a unique id; `seq` gives the insertion order used for
+    pagination.
+    """
+
+    def __init__(self, db_path, legacy_dir=None, max_batch=256):
+        self.db_path = db_path
+        self.legacy_dir = legacy_dir
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.writer = None
+        self.initialized = False
+        # held while a batch is committed and its listeners notified
+        self.write_lock = threading.Lock()
+        self.listeners = []
+
+    def connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def start(self):
+        with self.lock:
+            if self.writer is not None and self.writer.is_alive():
+                return
+            if not self.initialized:
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+                connection = self.connect()
+                try:
+                    with connection:
+                        connection.execute(SUBMISSIONS_SCHEMA)
+                        self.import_legacy(connection)
+                finally:
+                    connection.close()
+                self.initialized = True
+            # (re)started if the previous writer died, so submit never waits
+            # on a queue nobody drains
+            self.writer = threading.Thread(target=self.write_loop, daemon=True)
+            self.writer.start()
+
+    def import_legacy(self, connection):
+        # one-submission-per-file JSONs written before the store existed
+        if self.legacy_dir is None:
+            return
+        for filepath in sorted(glob.glob(os.path.join(self.legacy_dir, "*.json"))):
+            submission_id = os.path.basename(filepath).replace(".json", "")
+            with open(filepath, "r", encoding="utf-8") as f:
+                body = f.read()
+            received_at = datetime.fromtimestamp(os.path.getmtime(filepath))
+            connection.execute(
+                "INSERT OR IGNORE INTO submissions (id, received_at, body) VALUES (?, ?, ?)",
+                (submission_id, received_at.isoformat(), body),
+            )
+
+    def submit(self, data):
+        """Store one submission, returning (id, seq) once it is committed."""
+        self.start()
+        now = datetime.now()
+        submission_id = "{}_{}".format(now.strftime("%Y%m%d_%H%M%S"), uuid.uuid4().hex)
+        pending = {
+            "row": (
+                submission_id,
+                now.isoformat(),
+                json.dumps(data, ensure_ascii=False),
+            ),
+            "done": threading.Event(),
+            "seq": None,
+            "error": None,
+        }
+        self.queue.put(pending)
+        pending["done"].wait()
+        if pending["error"] is not None:
+            raise pending["error"]
+        return submission_id, pending["seq"]
+
+    def write_loop(self):
+        connection = None
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if connection is None:
+                    connection = self.connect()
+                self.write_batch(connection, batch)
+            except Exception as e:
+                logger.exception("failed to store %d submissions", len(batch))
+                for pending in batch:
+                    pending["error"] = e
+                if connection is not None:
+                    # reconnect for the next batch
+                    connection.close()
+                    connection = None
+            finally:
+                for pending in batch:
+                    pending["done"].set()
+
+    def write_batch(self, connection, batch):
+        with self.write_lock:
+            with connection:
+                for pending in batch:
+                    cursor = connection.execute(
+                        "INSERT INTO submissions (id, received_at, body) VALUES (?, ?, ?)",
+                        pending["row"],
+                    )
+                    pending["seq"] = cursor.lastrowid
+            for pending in batch:
+                self.notify(json.loads(pending["row"][2]))
+
+    def subscribe(self, listener):
+        """
+        Call `listener(submission)` for every stored submission, then for
+        each new one right after it is committed. No submission is missed
+        or seen twice.
+        """
+        self.start()
+        with self.write_lock:
+            after = 0
+            while after is not None:
+                page = self.page(limit=1000, after=after)
+                for row in page["submissions"]:
+                    self.call_listener(listener, row["submission"])
+                after = page["next_after"]
+            self.listeners.append(listener)
+
+    def notify(self, submission):
+        for listener in self.listeners:
+            self.call_listener(listener, submission)
+
+    def call_listener(self, listener, submission):
+        try:
+            listener(submission)
+        except Exception:
+            # a broken listener or a malformed submission must not fail the
+            # submission or the replay
+            logger.exception("submission listener failed")
+
+    def page(self, limit=50, after=0):
+        """Up to `limit` submissions with seq > `after`, oldest first."""
+        self.start()
+        connection = self.connect()
+        try:
+            rows = connection.execute(
+                "SELECT seq, id, received_at, body FROM submissions WHERE seq > ? ORDER BY seq LIMIT ?",
+                (after, limit),
+            ).fetchall()
+        finally:
+            connection.close()
+        submissions = [
+            {
+                "seq": seq,
+                "submission_id": submission_id,
+                "received_at": received_at,
+                "submission": json.loads(body),
+            }
+            for seq, submission_id, received_at, body in rows
+        ]
+        return {
+            "submissions": submissions,
+            "next_after": rows[-1][0] if len(rows) == limit else None,
+        }
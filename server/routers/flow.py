@@ -1,6 +1,8 @@
 import glob
 from io import StringIO
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query, Response
+from typing import Any, List, Optional
+from pydantic import BaseModel
 import json
 from functools import cmp_to_key
 import copy
@@ -20,6 +22,30 @@ metadata_path = relative_path("flow_data/metadata/")
 # backup can be found under '../data/json/chunked_summary/'
 # data_path = relative_path("data/tmp/chunked_summary/")
 data_path = relative_path("flow_data/chunked_summary/")
+# optional precompiled pack of the files above, see FlowDBUtils/pack.py
+pack_path = relative_path("flow_data/flow_pack.sqlite")
+
+
+class DataEdit(BaseModel):
+    pid: str
+    action: str
+    section: str
+    column: Optional[str] = None
+    before: Any = None
+    before_value: Any = None
+    after: Any = None
+
+
+class MetadataEdit(BaseModel):
+    action: str
+    section: str
+    column: Optional[str] = None
+    value: Any = None
+
+
+class EditBatch(BaseModel):
+    data: List[DataEdit] = []
+    metadata: List[MetadataEdit] = []
 
 
 @router.get("/test/")
@@ -27,35 +53,176 @@ async def test():
     return "Hello CaDelta"
 
 
+# rebuilt only when one of the source files or the pack changes, edits to
+# a single participant's files are patched in place
+flow_cache = FlowDBUtils.SnapshotCache(
+    lambda: FlowDBUtils.FlowState(metadata_path, data_path, pack_path),
+    [
+        metadata_path + "*.json",
+        data_path + "*.json",
+        data_path + "metadata/*.json",
+        pack_path,
+    ],
+    patcher=lambda state, changed_paths: patch_flow_state(state, changed_paths),
+)
+# set FLOW_VERIFY_PATCHES=1 to check every patched state against a full
+# reload, falling back to the reload on a mismatch
+verify_patches = os.environ.get("FLOW_VERIFY_PATCHES") == "1"
+
+
+def patch_flow_state(state, changed_paths):
+    if not state.apply_changes(changed_paths):
+        return False
+    if verify_patches and not state.matches_rebuild():
+        print("flow cache: patched state differs from a full reload, reloading")
+        return False
+    return True
+
+
 @router.get("/data/")
-async def get_data():
-    res = reload_data(metadata_path, data_path)
+async def get_data(slim: bool = False, similarity_format: str = "json"):
+    """
+    `slim` leaves out the conversation transcripts, fetch them per
+    participant from /conversation/.
+    `similarity_format` = float32 or uint8 replaces the nested similarity
+    dict with the base64 matrix served by /similarities/.
+    """
+    state = flow_cache.get()
+    res = state.slim_payload() if slim else state.payload
+    if similarity_format != "json":
+        check_similarity_dtype(similarity_format)
+        res = {**res, "similarities": state.engine.encode_base64(similarity_format)}
     return res
 
 
-def reload_data(metadata_path, data_path):
-    metadata = FlowDBUtils.local.read_metadata(metadata_path)
-    participant_metadata_dict = FlowDBUtils.local.read_participant_metadata(data_path)
-    (
-        background,
-        drivers_of_change,
-        future_management,
-        decision_making,
-        participant_metadata,
-    ) = FlowDBUtils.local.read_data(data_path, participant_metadata_dict)
-    participant_data, category_dict = FlowDBUtils.post_process.prepareParticipantData(
-        background, drivers_of_change, future_management, decision_making
-    )
-    participant_similarities = FlowDBUtils.post_process.calculateSimilarity(
-        participant_data
-    )
+@router.get("/data/cache_stats/")
+async def get_data_cache_stats():
+    return flow_cache.stats()
+
+
+@router.get("/data/load_report/")
+async def get_data_load_report():
+    return flow_cache.get().load_report
+
+
+@router.get("/conversation/")
+async def get_conversation(participant: str, section: Optional[str] = None):
+    """
+    One participant's transcript for a section, or for all four sections
+    when `section` is omitted.
+    """
+    state = flow_cache.get()
+    if participant not in state.payload["participant_data"]:
+        raise HTTPException(
+            status_code=404, detail=f"Participant '{participant}' not found"
+        )
+    if section is None:
+        return {s: state.conversation(participant, s) for s in FlowDBUtils.SECTIONS}
+    if section not in FlowDBUtils.SECTIONS:
+        raise HTTPException(status_code=404, detail=f"Section '{section}' not found")
+    return state.conversation(participant, section)
+
+
+@router.get("/categories/query/")
+async def query_categories(q: str):
+    """
+    Participants matching a boolean expression over category_dict keys,
+    e.g. `factors-X AND fairness-unfair AND NOT categories-Y`.
+    """
+    index = flow_cache.get().category_index()
+    try:
+        bits, unknown = index.query(q)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid query: {e}")
+    ids = index.ids(bits)
     return {
-        "background": background,
-        "drivers_of_change": drivers_of_change,
-        "future_management": future_management,
-        "decision_making": decision_making,
-        "metadata": metadata,
-        "participant_data": participant_data,
-        "category_dict": category_dict,
-        "similarities": participant_similarities,
+        "query": q,
+        "ids": ids,
+        "count": len(ids),
+        "unknown_categories": unknown,
     }
+
+
+@router.get("/similarities/top_k/")
+async def get_top_k_similar(
+    participant: Optional[str] = None,
+    k: int = Query(5, ge=1),
+    min_score: float = 0.0,
+):
+    """
+    The k most similar participants for one participant, or for all of them
+    when `participant` is omitted, skipping peers scoring below `min_score`.
+    """
+    engine = flow_cache.get().engine
+    if participant is not None and participant not in engine.index:
+        raise HTTPException(
+            status_code=404, detail=f"Participant '{participant}' not found"
+        )
+    indices, scores = engine.nearest(k)
+    pids = [participant] if participant is not None else engine.pids
+    res = {}
+    for pid in pids:
+        row = engine.index[pid]
+        res[pid] = [
+            {"id": engine.pids[other], "similarity": float(score)}
+            for other, score in zip(indices[row], scores[row])
+            if score >= min_score
+        ]
+    return res
+
+
+@router.get("/similarities/")
+async def get_similarities(dtype: str = "float32", encoding: str = "base64"):
+    """
+    The full similarity matrix as an ordered id list plus a float32 or
+    quantized uint8 (score * 255) matrix.
+
+    encoding=base64 returns JSON {ids, dtype, shape, scale, data}.
+    encoding=binary returns application/octet-stream: a little-endian uint32
+    header length, the UTF-8 JSON header {ids, dtype, shape, scale}, then
+    the row-major matrix bytes.
+    """
+    check_similarity_dtype(dtype)
+    engine = flow_cache.get().engine
+    if encoding == "base64":
+        return engine.encode_base64(dtype)
+    if encoding != "binary":
+        raise HTTPException(status_code=400, detail=f"Unknown encoding '{encoding}'")
+    header, data = engine.encode(dtype)
+    header = json.dumps(header).encode("utf-8")
+    return Response(
+        content=len(header).to_bytes(4, "little") + header + data,
+        media_type="application/octet-stream",
+    )
+
+
+def check_similarity_dtype(dtype):
+    if dtype not in FlowDBUtils.SIMILARITY_DTYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown similarity format '{dtype}'",
+        )
+
+
+@router.post("/edit/")
+def edit_data(batch: EditBatch):
+    """
+    Apply a batch of participant edits (same arguments as update_data) and
+    category metadata edits (same arguments as update_metadata). Each file
+    is rewritten once, atomically; the cached snapshot picks the changes up
+    on the next read.
+    """
+    try:
+        res = FlowDBUtils.apply_edits(
+            data_path,
+            metadata_path,
+            [edit.model_dump() for edit in batch.data],
+            [edit.model_dump() for edit in batch.metadata],
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return res
+
+
+def reload_data(metadata_path, data_path):
+    return FlowDBUtils.FlowState(metadata_path, data_path, pack_path).payload
@@ -1,11 +1,11 @@
 import os
-import re
 import json
-from fastapi import APIRouter, HTTPException
+import asyncio
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Dict, Any
-
-# from .AutoGenUtils import query
+from typing import List, Dict, Any, Optional
+from . import LinkingUtils
 
 dirname = os.path.dirname(__file__)
 relative_path = lambda filename: os.path.join(dirname, "..", filename)
@@ -16,10 +16,19 @@ class ScenarioRequest(BaseModel):
     scenario: str
 
 
+class ScenarioCompareRequest(BaseModel):
+    scenarios: List[str]
+
+
 class CodeSummarizeRequest(BaseModel):
     code: str
 
 
+class CodeSummariesRequest(BaseModel):
+    codes: List[str]
+    generate: bool = False
+
+
 class CodeOccurrence(BaseModel):
     code_name: str
     occurrences: int
@@ -41,149 +50,156 @@ def get_scenarios():
     return data
 
 
+def encode_scenario_codes(res):
+    ScenarioCodesResponse(**res)
+    return json.dumps(res, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# encoded responses per scenario, rebuilt when either file changes
+scenario_cache = LinkingUtils.scenario_response_cache(
+    relative_path("linking_data/scenario_codes_manual.json"),
+    relative_path("linking_data/code_freq.json"),
+    encode_scenario_codes,
+)
+
+
 @router.post("/scenarios/codes_manual/", response_model=ScenarioCodesResponse)
 def get_scenario_codes_manual(request: ScenarioRequest):
     scenario = request.scenario
-    data = json.load(open(relative_path("linking_data/scenario_codes_manual.json"), encoding="utf-8"))
-    code_freq = json.load(open(relative_path("linking_data/code_freq.json"), encoding="utf-8"))
-    node_dict = {code["name"]: code for code in code_freq}
+    responses = scenario_cache.get()
 
-    if scenario not in data:
+    if scenario not in responses:
         raise HTTPException(
             status_code=404, detail=f"Scenario '{scenario}' not found in data"
         )
 
-    codes = data[scenario]
-    codes = remove_duplicates(codes)
-    codes = [
-        c for c in codes if c in node_dict
-    ]  # remove codes that are not in code_freq
-    node_dict = collect_scenario_children(codes, node_dict)
-    root = {
-        "name": "root",
-        "scenario_children": list(set([c.split("\\")[0] for c in codes])),
-    }
-    node_dict["root"] = root
-    root = dfs_collect_reference(root, node_dict)
-    new_node_dict = filter_node_dict(root, node_dict)
-    code_w_freq = [
-        {
-            "code_name": code,
-            "occurrences": node_dict[code]["references_count"],
-        }
-        for code in codes
-    ]
-    # with open("debug_node_dict.json", "w", encoding="utf-8") as f:
-    #     json.dump(list(new_node_dict.values()), f, indent=4, ensure_ascii=False)
-    return ScenarioCodesResponse(
-        occurrences=code_w_freq,
-        participants=list(new_node_dict.values()),
+    return Response(content=responses.get(scenario), media_type="application/json")
+
+
+@router.post("/scenarios/compare/")
+def compare_scenarios(request: ScenarioCompareRequest):
+    """
+    Codes and occurrences of each requested scenario, plus the shared codes
+    and participants (with their Jaccard index) of every pair of scenarios.
+    """
+    scenarios = list(dict.fromkeys(request.scenarios))
+    responses = scenario_cache.get()
+    for scenario in scenarios:
+        if scenario not in responses:
+            raise HTTPException(
+                status_code=404, detail=f"Scenario '{scenario}' not found in data"
+            )
+    return LinkingUtils.build_scenario_comparison(
+        scenarios, responses.scenario_codes, responses.trie
     )
 
 
+# inverted index of the reference texts, built over the scenario cache's
+# code trie and rebuilt with it when code_freq.json changes
+reference_index_cache = LinkingUtils.ReferenceIndexCache(
+    lambda: scenario_cache.get().trie
+)
+
+
+@router.get("/references/search/")
+def search_references(
+    q: str,
+    code: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=200),
+):
+    """
+    Coded references containing every word of `q`, best matches first,
+    optionally only those coded under the `code` subtree. Each result has
+    the code path, the participant, the reference's position in the code's
+    references and a snippet with the offsets of the matched words.
+    """
+    index = reference_index_cache.get()
+    try:
+        docs, terms = index.search(q, code)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Code '{code}' not found in data")
+    if len(terms) == 0:
+        raise HTTPException(status_code=400, detail="Query has no searchable words")
+    results = []
+    for doc in docs[offset : offset + limit]:
+        reference = index.reference(doc)
+        snippet, highlights = index.snippet(reference["reference"], terms)
+        results.append(
+            {
+                "code_name": index.codes[doc],
+                "position": index.positions[doc],
+                "participant": reference["participant"],
+                "participant_id": LinkingUtils.participant_short_id(
+                    reference["participant"]
+                ),
+                "snippet": snippet,
+                "highlights": highlights,
+            }
+        )
+    return {"total": len(docs), "offset": offset, "limit": limit, "results": results}
+
+
+# summaries from code_summaries.json, reloaded when the file changes
+code_summaries = LinkingUtils.code_summaries_cache(
+    relative_path("linking_data/code_summaries.json")
+)
+# generated summaries of codes missing from code_summaries.json
+summary_cache = LinkingUtils.SummaryCache(relative_path("linking_data/summary_cache"))
+
+
+async def summarize_code(code, generate=True):
+    """
+    The summary of `code` from code_summaries.json, else generated from its
+    references. None if the code has neither or `generate` is false.
+    """
+    # the caches may parse files or wait on a rebuild, keep that off the loop
+    summaries = await run_in_threadpool(code_summaries.get)
+    if code in summaries:
+        return summaries[code]
+    trie = (await run_in_threadpool(scenario_cache.get)).trie
+    if not generate or not trie.is_code(code):
+        return None
+    references = list(trie.nodes[code].entry["references"])
+    if len(references) == 0:
+        return None
+    return await summary_cache.get(references)
+
+
 @router.post("/codes/summarize/")
 async def codes_summarize(request: CodeSummarizeRequest):
     code = request.code
-    code_summaries = json.load(open(relative_path("linking_data/code_summaries.json"), encoding="utf-8"))
-    code_summaries_dict = {item["name"]: item["summary"] for item in code_summaries}
-    if code not in code_summaries_dict:
+    try:
+        summary = await summarize_code(code)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Failed to summarize code: {e}")
+    if summary is None:
         raise HTTPException(status_code=404, detail=f"Code '{code}' not found in data")
-    return code_summaries_dict[code]
-
-
-#     references = code["references"]
-#     references_text = ""
-#     for ref in references:
-#         participant_text = ref["participant"]
-#         match = re.search(r"Files\\\\([A-Z]+) Transcript", participant_text)
-#         if match:
-#             participant = match.group(1)  # Output: AF or ABC
-#         else:
-#             participant = "unknown"
-#         references_text += """
-#         <reference>
-#             <reference_text> {reference} </reference_text>
-#             <from_participant> {participant} </from_participant>
-#         </reference
-#         """.format(
-#             reference=ref["reference"], participant=participant
-#         )
-
-#     print(references_text)
-#     messages = [
-#         {
-#             "source": "user",
-#             "content": """
-#             Summarize the references for me in a concise way. Use only one short sentence for each bullet point.
-#             Give me no more than 5 bullet points.
-#             References: {references_text}
-#             """.format(
-#                 references_text=references_text
-#             ),
-#         }
-#     ]
-#     response, messages = await query.chat(
-#         messages, "gpt-4o-mini", open("api_key").read().strip(), temperature=1
-#     )
-#     return {"response": response}
-
-
-def remove_duplicates(codes):
-    no_duplicates = []
-    for i in range(len(codes)):
-        find_duplicate = False
-        for j in range(len(codes)):
-            if i != j and codes[i] in codes[j]:
-                find_duplicate = True
-                break
-        if not find_duplicate:
-            no_duplicates.append(codes[i])
-    return list(set(no_duplicates))
-
-
-def collect_scenario_children(nodes, node_dict):
-    hierarchy = {}
-    parent_dict = {}
-    for node in nodes:
-        for i in range(1, len(node.split("\\"))):
-            parent = "\\".join(node.split("\\")[:i])
-            child = "\\".join(node.split("\\")[: i + 1])
-            if parent not in hierarchy:
-                hierarchy[parent] = set()
-            hierarchy[parent].add(child)
-            if child not in hierarchy:
-                hierarchy[child] = set()
-                parent_dict[child] = set()
-            parent_dict[child].add(parent)
-    for node, children in hierarchy.items():
-        node_dict[node]["scenario_children"] = list(children)
-    return node_dict
-
-
-def dfs_collect_reference(node, node_dict):
-    node["participants"] = set()
-    node["references_count"] = 0
-    if len(node["scenario_children"]) == 0:
-        node_dict[node["name"]]["participants"] = list(
-            set([r["participant"] for r in node["references"]])
-        )
-        node_dict[node["name"]]["references_count"] = len(node["references"])
-        return node_dict[node["name"]]
-    for child in node["scenario_children"]:
-        child = dfs_collect_reference(node_dict[child], node_dict)
-        node["participants"].update(child["participants"])
-        node["references_count"] += child["references_count"]
-    node_dict[node["name"]]["participants"] = list(
-        node_dict[node["name"]]["participants"]
+    return summary
+
+
+@router.post("/codes/summaries/")
+async def codes_summaries(request: CodeSummariesRequest):
+    """
+    Summaries of many codes at once. Codes without a summary are generated
+    only if `generate` is true, a few at a time; codes that still have none
+    are listed in `missing`, with the reason in `errors` when generation
+    failed.
+    """
+    codes = list(dict.fromkeys(request.codes))
+    results = await asyncio.gather(
+        *[summarize_code(code, request.generate) for code in codes],
+        return_exceptions=True,
     )
-    return node_dict[node["name"]]
-
-
-def filter_node_dict(root, node_dict, new_node_dict={}):
-    stack = [root]
-    while len(stack) > 0:
-        current = stack.pop()
-        new_node_dict[current["name"]] = current
-        for child in current["scenario_children"]:
-            stack.append(node_dict[child])
-    return new_node_dict
+    summaries = {}
+    missing = []
+    errors = {}
+    for code, result in zip(codes, results):
+        if isinstance(result, Exception):
+            errors[code] = str(result)
+            missing.append(code)
+        elif result is None:
+            missing.append(code)
+        else:
+            summaries[code] = result
+    return {"summaries": summaries, "missing": missing, "errors": errors}
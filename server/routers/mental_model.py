@@ -1,23 +1,55 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query
 import os
 import json
-import glob
+import threading
 from collections import defaultdict
 from pydantic import BaseModel
-from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from . import MentalModelUtils
 
 router = APIRouter()
 
 dirname = os.path.dirname(__file__)
 server_path = lambda filename: os.path.join(dirname, "..", filename)
+codebook_path = server_path("mm_data/all_codes.json")
+
+# interview mental models, reparsed per file on change
+interview_index = MentalModelUtils.MentalModelIndex(
+    server_path("mm_data/MMs/*.json"), MentalModelUtils.prefilter_interview_mm
+)
+
+
+exhibition_index = MentalModelUtils.MentalModelIndex(
+    server_path("mm_data/exhibition/*.json"), MentalModelUtils.filter_exhibition_mm
+)
+
+
+def refresh_interview_index():
+    codebook = MentalModelUtils.get_shared_codebook(codebook_path)
+    return interview_index.refresh(codebook)
+
+
+def refresh_exhibition_index():
+    codebook = MentalModelUtils.get_shared_codebook(codebook_path)
+    return exhibition_index.refresh(codebook)
+
+
+def interview_columns(index):
+    return index.view(
+        "columns", lambda index: MentalModelUtils.EntryColumns(index.participants())
+    )
+
+
+def quality_criteria(criteria):
+    try:
+        return MentalModelUtils.parse_criteria(criteria)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/codebook/")
 def get_codebook():
-    codebook = json.load(
-        open(server_path("mm_data/all_codes.json"), "r", encoding="utf-8")
-    )
+    codebook = MentalModelUtils.get_shared_codebook(codebook_path).codes
     return codebook
 
 
@@ -29,49 +61,49 @@ def get_codebook_parent_tsne():
     return parent_code_tsne
 
 
+parent_layout = MentalModelUtils.ParentLayout()
+
+
+@router.get("/codebook/parent_layout/")
+def get_codebook_parent_layout():
+    """
+    {parent code: x in (0, 1)} like parent_tsne/, computed from the current
+    codebook so it follows changes to all_codes.json.
+    """
+    codebook = MentalModelUtils.get_shared_codebook(codebook_path)
+    return parent_layout.get(codebook)
+
+
 @router.get("/mental_model/exhibition_individual/")
-def get_exhibition_individual():
-    exhibition_MMs = []
-    codes = json.load(
-        open(server_path("mm_data/all_codes.json"), "r", encoding="utf-8")
+def get_exhibition_individual(criteria: Optional[str] = None):
+    """
+    `criteria` is a comma-separated subset of the quality checks an entry
+    must pass ("Good"), all six by default.
+    """
+    criteria = quality_criteria(criteria)
+    return refresh_interview_index().view(
+        ("exhibition_individual", criteria),
+        lambda index: build_exhibition_individual(index, criteria),
     )
-    parent_code_dict = {code["name"]: code["parent"] for code in codes}
-    code_type_dict = {code["name"]: code["type"] for code in codes}
-    all_codes = [code["name"] for code in codes]
+
+
+def build_exhibition_individual(index, criteria):
+    codebook = index.codebook
+    exhibition_MMs = []
     participants = []
-    for participant_MM_file in glob.glob(server_path("mm_data/MMs/*.json")):
-        with open(participant_MM_file, "r") as f:
-            participant_MM = json.load(f)
-            participant_MM = list(
-                filter(lambda x: x["code_name"] in all_codes, participant_MM)
-            )
-            participant_MM = list(filter(lambda x: x["mentioned"], participant_MM))
-            participant_MM = list(filter(lambda x: x["impact"], participant_MM))
-            participant_MM = list(
-                filter(
-                    lambda x: x["logical_connection"] == "Good"
-                    and x["significance"] == "Good"
-                    and x["relevance"] == "Good"
-                    and x["inference"] == "Good"
-                    and x["interpretation"] == "Good"
-                    and x["preciseness"] == "Good",
-                    participant_MM,
-                )
-            )
-            participant_MM = [
-                {
-                    "node": mm["code_name"],
-                    "parent": (
-                        parent_code_dict[mm["code_name"]]
-                        if parent_code_dict[mm["code_name"]] != "N/A"
-                        else mm["code_name"]
-                    ),
-                    "classification": code_type_dict.get(mm["code_name"], "Unknown"),
-                }
-                for mm in participant_MM
-            ]
+    for participant_id, participant_MM in interview_columns(index).participants(
+        criteria
+    ):
+        participant_MM = [
+            {
+                "node": mm["code_name"],
+                "parent": codebook.parent_or_self(mm["code_name"]),
+                "classification": codebook.type_dict.get(mm["code_name"], "Unknown"),
+            }
+            for mm in participant_MM
+        ]
         exhibition_MMs.append(participant_MM)
-        participants.append(participant_MM_file.split("/")[-1].split(".")[0])
+        participants.append(participant_id)
 
     return {"participants": participants, "mental_models": exhibition_MMs}
 
@@ -79,23 +111,12 @@ def get_exhibition_individual():
 # Aggregated mental model results from all exhibitions
 @router.get("/mental_model/exhibition/")
 def get_exhibition_MM():
+    return refresh_exhibition_index().view("exhibition", build_exhibition_MM)
+
+
+def build_exhibition_MM(index):
     all_MMs = defaultdict(list)
-    code_book = json.load(open(server_path("mm_data/all_codes.json")))
-    all_codes = [code["name"] for code in code_book]
-    parent_code_dict = {}  # from code to parent code
-    for code in code_book:
-        code_name = code["name"]
-        parent_code = code["parent"]
-        if parent_code != "N/A":
-            parent_code_dict[code_name] = parent_code
-        else:
-            parent_code_dict[code_name] = code_name
-    for participant_MM_file in glob.glob(server_path("mm_data/exhibition/*.json")):
-        participant_id = participant_MM_file.split("/")[-1].split(".")[0]
-        participant_MM = json.load(open(participant_MM_file))
-        participant_MM = list(
-            filter(lambda x: x["code_name"] in all_codes, participant_MM)
-        )
+    for participant_id, participant_MM in index.participants():
         code_names = set([c["code_name"] for c in participant_MM])
         for c in code_names:
             if c == "Local surface water supply":
@@ -106,50 +127,197 @@ def get_exhibition_MM():
 
 # Aggregated mental model results from all interviews
 @router.get("/mental_model/interview/")
-def get_interview_Mm():
-    all_MMs = defaultdict(list)
-    code_book = json.load(open(server_path("mm_data/all_codes.json")))
-    all_codes = [code["name"] for code in code_book]
-    parent_code_dict = {}  # from code to parent code
-    for code in code_book:
-        code_name = code["name"]
-        parent_code = code["parent"]
-        if parent_code != "N/A":
-            parent_code_dict[code_name] = parent_code
-        else:
-            parent_code_dict[code_name] = code_name
-    for participant_MM_file in glob.glob(server_path("mm_data/MMs/*.json")):
-        participant_id = participant_MM_file.split("/")[-1].split(".")[0]
-        participant_MM = json.load(open(participant_MM_file))
-        participant_MM = list(
-            filter(lambda x: x["code_name"] in all_codes, participant_MM)
-        )
-        participant_MM = list(filter(lambda x: x["mentioned"], participant_MM))
-        participant_MM = list(filter(lambda x: x["impact"], participant_MM))
-        participant_MM = list(
-            filter(
-                lambda x: x["logical_connection"] == "Good"
-                and x["significance"] == "Good"
-                and x["relevance"] == "Good"
-                and x["inference"] == "Good"
-                and x["interpretation"] == "Good"
-                and x["preciseness"] == "Good",
-                participant_MM,
-            )
-        )
-        # code_names = set([c["code_name"] for c in participant_MM])
-        # code_names = set(
-        #     [parent_code_dict[c["code_name"]] for c in participant_MM]
-        # )  # keep only the parent code
-        code_names = set([c["code_name"] for c in participant_MM])
-        for c in code_names:
-            # all_MMs[c] += 1
-            if c == "Local surface water supply":
-                continue
-            all_MMs[c].append(participant_id)
+def get_interview_Mm(criteria: Optional[str] = None):
+    """
+    `criteria` is a comma-separated subset of the quality checks an entry
+    must pass ("Good"), all six by default.
+    """
+    criteria = quality_criteria(criteria)
+    return refresh_interview_index().view(
+        ("interview", criteria), lambda index: build_interview_MM(index, criteria)
+    )
+
+
+def build_interview_MM(index, criteria):
+    all_MMs = interview_columns(index).code_participants(criteria)
+    all_MMs.pop("Local surface water supply", None)
     return all_MMs
 
 
+def interview_incidence(index, criteria):
+    return index.view(
+        ("incidence", criteria),
+        lambda index: MentalModelUtils.Incidence(
+            interview_columns(index).participant_ids,
+            build_interview_MM(index, criteria),
+        ),
+    )
+
+
+def exhibition_incidence(index):
+    return index.view(
+        "incidence",
+        lambda index: MentalModelUtils.Incidence(
+            [pid for pid, _ in index.participants()], build_exhibition_MM(index)
+        ),
+    )
+
+
+@router.get("/mental_model/rollup/")
+def get_MM_rollup(criteria: Optional[str] = None):
+    """
+    Participants and counts per code and per parent code, for interviews
+    (filtered by the quality `criteria`, all six by default) and exhibitions.
+    """
+    criteria = quality_criteria(criteria)
+    interview = refresh_interview_index().view(
+        ("rollup", criteria),
+        lambda index: build_rollup(index, interview_incidence(index, criteria)),
+    )
+    exhibition = refresh_exhibition_index().view(
+        "rollup", lambda index: build_rollup(index, exhibition_incidence(index))
+    )
+    return {"interview": interview, "exhibition": exhibition}
+
+
+def build_rollup(index, incidence):
+    parents, parent_matrix = incidence.rollup(index.codebook.parent_or_self)
+    return {
+        "participants": len(incidence.participant_ids),
+        "codes": incidence.summarize(incidence.matrix, incidence.code_names),
+        "parents": incidence.summarize(parent_matrix, parents),
+    }
+
+
+@router.get("/mental_model/cooccurrence/")
+def get_MM_cooccurrence(
+    source: str = "interview",
+    score: Optional[str] = None,
+    top: Optional[int] = Query(None, ge=1),
+    criteria: Optional[str] = None,
+):
+    """
+    How many participants mention each pair of codes together, for the
+    interview (filtered by quality `criteria`) or exhibition mental models.
+
+    `score` adds a normalized `lift` or `jaccard` matrix. With `top`, only
+    the N strongest pairs are returned, ranked by score or else by count.
+    """
+    if source == "interview":
+        criteria = quality_criteria(criteria)
+        index = refresh_interview_index()
+        key = ("cooccurrence", criteria)
+        get_incidence = lambda index: interview_incidence(index, criteria)
+    elif source == "exhibition":
+        index = refresh_exhibition_index()
+        key = ("cooccurrence",)
+        get_incidence = exhibition_incidence
+    else:
+        raise HTTPException(status_code=404, detail=f"Unknown source '{source}'")
+    if score not in (None, "lift", "jaccard"):
+        raise HTTPException(status_code=400, detail=f"Unknown score '{score}'")
+    incidence, counts, scores = index.view(
+        key + (score,), lambda index: build_cooccurrence(get_incidence(index), score)
+    )
+
+    if top is None:
+        res = {"codes": incidence.code_names, "counts": counts.tolist()}
+        if scores is not None:
+            res[score] = scores.tolist()
+        return res
+    rows, cols = MentalModelUtils.top_pairs(
+        counts, scores if scores is not None else counts, top
+    )
+    pairs = []
+    for i, j in zip(rows, cols):
+        pair = {
+            "source": incidence.code_names[i],
+            "target": incidence.code_names[j],
+            "count": int(counts[i, j]),
+        }
+        if scores is not None:
+            pair[score] = float(scores[i, j])
+        pairs.append(pair)
+    return {"pairs": pairs}
+
+
+def build_cooccurrence(incidence, score):
+    counts = incidence.cooccurrence()
+    scores = None
+    if score is not None:
+        scores = incidence.cooccurrence_scores(counts, score)
+    return incidence, counts, scores
+
+
+@router.get("/mental_model/clusters/")
+def get_MM_clusters(
+    source: str = "interview",
+    metric: str = "jaccard",
+    k: Optional[int] = Query(None, ge=1),
+    threshold: Optional[float] = None,
+    top_codes: int = Query(5, ge=0),
+    include_similarity: bool = False,
+    criteria: Optional[str] = None,
+):
+    """
+    Participant clusters from average-linkage hierarchical clustering of
+    the participant x participant `metric` (jaccard or cosine) similarity.
+
+    The tree is cut into `k` clusters, or wherever the distance
+    (1 - similarity) exceeds `threshold`; 4 clusters by default. Each
+    cluster lists its members and its most prevalent codes.
+    """
+    if source == "interview":
+        criteria = quality_criteria(criteria)
+        index = refresh_interview_index()
+        key = ("clusters", criteria, metric)
+        get_incidence = lambda index: interview_incidence(index, criteria)
+    elif source == "exhibition":
+        index = refresh_exhibition_index()
+        key = ("clusters", metric)
+        get_incidence = exhibition_incidence
+    else:
+        raise HTTPException(status_code=404, detail=f"Unknown source '{source}'")
+    if metric not in MentalModelUtils.SIMILARITY_METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric '{metric}'")
+    if k is None and threshold is None:
+        k = 4
+    incidence, similarity, merges = index.view(
+        key, lambda index: build_clustering(get_incidence(index), metric)
+    )
+
+    n = len(incidence.participant_ids)
+    labels = MentalModelUtils.cut_linkage(merges, n, k=k, threshold=threshold)
+    clusters = []
+    for label in range(max(labels, default=-1) + 1):
+        members = [i for i in range(n) if labels[i] == label]
+        clusters.append(
+            {
+                "id": label,
+                "size": len(members),
+                "members": [incidence.participant_ids[i] for i in members],
+                "representative_codes": MentalModelUtils.representative_codes(
+                    incidence, members, top_codes
+                ),
+            }
+        )
+    res = {
+        "participants": incidence.participant_ids,
+        "assignments": dict(zip(incidence.participant_ids, labels)),
+        "clusters": clusters,
+    }
+    if include_similarity:
+        res["similarity"] = similarity.tolist()
+    return res
+
+
+def build_clustering(incidence, metric):
+    # the linkage is cached, only the cut depends on the request
+    similarity = MentalModelUtils.participant_similarity(incidence, metric)
+    merges = MentalModelUtils.average_linkage(1 - similarity)
+    return incidence, similarity, merges
+
+
 # Pydantic models for request/response validation
 class Factor(BaseModel):
     name: str
@@ -169,30 +337,58 @@ class MentalModelSubmission(BaseModel):
     demographics: Demographics
 
 
+# public submissions, see MentalModelUtils.SubmissionStore
+submission_store = MentalModelUtils.SubmissionStore(
+    server_path("submissions/submissions.sqlite3"),
+    legacy_dir=server_path("submissions"),
+)
+
+
 @router.post("/submit/")
 def submit_mental_model(submission: MentalModelSubmission):
     """
     Submit a mental model with demographic data
     """
     try:
-        # Create submissions directory if it doesn't exist
-        submissions_dir = server_path("submissions")
-        os.makedirs(submissions_dir, exist_ok=True)
-
-        # Generate a unique filename based on timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"submission_{timestamp}.json"
-        filepath = os.path.join(submissions_dir, filename)
-
-        # Save the submission data
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(submission.dict(), f, indent=2, ensure_ascii=False)
+        submission_id, _ = submission_store.submit(submission.dict())
 
         return {
             "status": "success",
             "message": "Mental model and demographic data submitted successfully",
-            "submission_id": timestamp,
+            "submission_id": submission_id,
         }
 
     except Exception as e:
         return {"status": "error", "message": f"Failed to submit data: {str(e)}"}
+
+
+@router.get("/submissions/")
+def get_submissions(limit: int = Query(50, ge=1, le=1000), after: int = 0):
+    """
+    Stored submissions, oldest first. Pass the returned `next_after` as
+    `after` to get the next page; it is null on the last page.
+    """
+    return submission_store.page(limit, after)
+
+
+live_counters = MentalModelUtils.LiveCounters()
+live_counters_lock = threading.Lock()
+live_counters_subscribed = False
+
+
+@router.get("/mental_model/exhibition/live/")
+def get_exhibition_live():
+    """
+    Live per-code counts and demographic breakdowns of the public
+    submissions, kept up to date as each submission is committed.
+    """
+    global live_counters, live_counters_subscribed
+    with live_counters_lock:
+        if not live_counters_subscribed:
+            # counts the stored submissions once, then follows new ones; fresh
+            # counters so a failed attempt never leaves partial counts behind
+            counters = MentalModelUtils.LiveCounters()
+            submission_store.subscribe(counters.add)
+            live_counters = counters
+            live_counters_subscribed = True
+    return live_counters.totals()
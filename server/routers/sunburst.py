@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
+from . import MentalModelUtils
 
 import os
 import json
@@ -79,18 +80,16 @@ async def get_code_definition(request: CodeRequest):
         if not os.path.exists(all_codes_path):
             raise HTTPException(status_code=404, detail="all_codes.json file not found")
 
-        # Load the codes data
-        with open(all_codes_path, "r", encoding="utf-8") as file:
-            codes_data = json.load(file)
-
-        # Find the code by name
-        for code in codes_data:
-            if code.get("name") == code_name:
-                return code
+        # Shared codebook, reparsed only when the file changes
+        codebook = MentalModelUtils.get_shared_codebook(all_codes_path)
+        if code_name in codebook.by_name:
+            return codebook.by_name[code_name]
 
         # If code not found
         raise HTTPException(status_code=404, detail=f"Code '{code_name}' not found")
 
+    except HTTPException:
+        raise
     except json.JSONDecodeError:
         raise HTTPException(
             status_code=500, detail="Invalid JSON in all_codes.json file"